@@ -1,276 +1,179 @@
-import pandas as pd
+from array import array
+from collections import deque
+import numpy as np
 import random
 
+# Cell codes used while generating a maze
+_UNVISITED, _CELL, _WALL, _ENTRANCE, _EXIT, _OUTSIDE = range(6)
+
+
+def generate_codes(cols, rows, seed=None):
+    """
+    Randomized Prim's algorithm, returning a (rows, cols) uint8 array of
+    cell codes (_CELL, _WALL, _ENTRANCE, _EXIT). The grid is a flat bytearray
+    of cell codes (viewed as a NumPy array once done) and the frontier of
+    walls is a list with O(1) swap-remove plus a membership flag per cell, so
+    generation is linear in the maze area.
+    """
+    height = rows
+    width = cols
+    rng = random.Random(seed)
+    # One cell of _OUTSIDE padding around the grid spares all bounds checks
+    stride = width + 2
+    maze = bytearray([_OUTSIDE]) * (stride * (height + 2))
+    for r in range(1, height + 1):
+        maze[r * stride + 1:r * stride + 1 + width] = bytes(width)  # _UNVISITED
+    in_frontier = bytearray(len(maze))
+    frontier = []
+
+    def add_walls_around(p):
+        for q in (p - stride, p + stride, p - 1, p + 1):
+            code = maze[q]
+            if code != _CELL and code != _OUTSIDE:
+                maze[q] = _WALL
+                if not in_frontier[q]:
+                    in_frontier[q] = 1
+                    frontier.append(q)
+
+    # Randomize starting point (away from the border) and set it a cell
+    starting_height = min(max(int(rng.random() * height), 1), height - 2)
+    starting_width = min(max(int(rng.random() * width), 1), width - 2)
+    start = (starting_height + 1) * stride + starting_width + 1
+    maze[start] = _CELL
+    add_walls_around(start)
+
+    rand = rng.random
+    while frontier:
+        # Pick a random wall and swap-remove it from the frontier
+        i = int(rand() * len(frontier))
+        p = frontier[i]
+        frontier[i] = frontier[-1]
+        frontier.pop()
+        in_frontier[p] = 0
+
+        left, right, up, down = maze[p - 1], maze[p + 1], maze[p - stride], maze[p + stride]
+        # The wall becomes a path if it separates a cell from an unvisited
+        # cell and touches at most one cell
+        if ((left == _UNVISITED and right == _CELL) or (right == _UNVISITED and left == _CELL)
+                or (up == _UNVISITED and down == _CELL) or (down == _UNVISITED and up == _CELL)):
+            if (left == _CELL) + (right == _CELL) + (up == _CELL) + (down == _CELL) < 2:
+                maze[p] = _CELL
+                add_walls_around(p)
+
+    grid = np.frombuffer(maze, dtype=np.uint8).reshape(height + 2, stride)[1:-1, 1:-1].copy()
+    # Mark the remaining unvisited cells as walls
+    grid[grid == _UNVISITED] = _WALL
+
+    # Set entrance and exit
+    cells = np.flatnonzero(grid[1] == _CELL)
+    if len(cells):
+        grid[0, cells[0]] = _ENTRANCE
+    cells = np.flatnonzero(grid[height - 2, 1:] == _CELL)
+    if len(cells):
+        grid[height - 1, cells[-1] + 1] = _EXIT
+    return grid
+
+
+def cell_values(codes, wall_value, corridor_value, entrance_exit_value):
+    """The object array of cell values for an array of cell codes"""
+    values = np.empty(5, dtype=object)
+    values[[_UNVISITED, _WALL]] = wall_value
+    values[_CELL] = corridor_value
+    values[_ENTRANCE] = entrance_exit_value
+    values[_EXIT] = -entrance_exit_value
+    return values[codes]
+
 
 class Maze:
-    def __init__(self, size, wall_value, corridor_value, entrance_exit_value, agent_value, visited_value):
+    """
+    A maze stored as a NumPy array of cell values, `maze[y, x]` being the
+    cell at location (x, y).
+    A maze is generated from `seed` unless it is given as the array `codes`
+    of its cell codes.
+    `exit_distance[y, x]` is the number of steps from (x, y) to the exit along
+    the corridors, computed once by a BFS from the exit, and -1 for the walls
+    and the cells that cannot reach it.
+    """
+    def __init__(self, size, wall_value, corridor_value, entrance_exit_value, agent_value, visited_value,
+                 seed=None, codes=None):
         self.cols = size[0]
         self.rows = size[1]
-        self.maze = self.maze_generator(wall_value, corridor_value, entrance_exit_value)
-        self.entrance = self.get_value_location(entrance_exit_value)[0]
-        self.exit = self.get_value_location(-entrance_exit_value)[0]
+        if codes is None:
+            self.maze = self.maze_generator(wall_value, corridor_value, entrance_exit_value, seed)
+        else:  # a maze generated earlier, e.g. loaded by maze_file
+            self.maze = cell_values(codes, wall_value, corridor_value, entrance_exit_value)
         self.wall_value = wall_value
         self.corridor_value = corridor_value
         self.entrance_exit_value = entrance_exit_value
         self.agent_value = agent_value
         self.visited_value = visited_value
 
-    def maze_generator(self, numerical_wall_value, numerical_corridor_value, numerical_entrance_exit_value):
-        def surroundingCells(_rand_wall):
-            _s_cells = 0
-            if maze[_rand_wall[0] - 1][_rand_wall[1]] == 'c':
-                _s_cells += 1
-            if maze[_rand_wall[0] + 1][_rand_wall[1]] == 'c':
-                _s_cells += 1
-            if maze[_rand_wall[0]][_rand_wall[1] - 1] == 'c':
-                _s_cells += 1
-            if maze[_rand_wall[0]][_rand_wall[1] + 1] == 'c':
-                _s_cells += 1
-
-            return _s_cells
-
-        height = self.rows
-        width = self.cols
-        cell = 'c'
-        unvisited = 'u'
-        maze = []
-
-        for i in range(0, height):
-            line = []
-            for j in range(0, width):
-                line.append(unvisited)
-            maze.append(line)
-
-        # Randomize starting point and set it a cell
-        starting_height = int(random.random() * height)
-        starting_width = int(random.random() * width)
-        if starting_height == 0:
-            starting_height += 1
-        if starting_height == height - 1:
-            starting_height -= 1
-        if starting_width == 0:
-            starting_width += 1
-        if starting_width == width - 1:
-            starting_width -= 1
-
-        # Mark it as cell and add surrounding walls to the list
-        maze[starting_height][starting_width] = cell
-        walls = [[starting_height - 1, starting_width], [starting_height, starting_width - 1],
-                 [starting_height, starting_width + 1], [starting_height + 1, starting_width]]
-
-        # Denote walls in maze
-        maze[starting_height - 1][starting_width] = 'w'
-        maze[starting_height][starting_width - 1] = 'w'
-        maze[starting_height][starting_width + 1] = 'w'
-        maze[starting_height + 1][starting_width] = 'w'
-
-        while walls:
-            # Pick a random wall
-            rand_wall = walls[int(random.random() * len(walls)) - 1]
-
-            # Check if it is a left wall
-            if rand_wall[1] != 0:
-                if maze[rand_wall[0]][rand_wall[1] - 1] == 'u' and maze[rand_wall[0]][rand_wall[1] + 1] == 'c':
-                    # Find the number of surrounding cells
-                    s_cells = surroundingCells(rand_wall)
-
-                    if s_cells < 2:
-                        # Denote the new path
-                        maze[rand_wall[0]][rand_wall[1]] = 'c'
-
-                        # Mark the new walls
-                        # Upper cell
-                        if rand_wall[0] != 0:
-                            if maze[rand_wall[0] - 1][rand_wall[1]] != 'c':
-                                maze[rand_wall[0] - 1][rand_wall[1]] = 'w'
-                            if [rand_wall[0] - 1, rand_wall[1]] not in walls:
-                                walls.append([rand_wall[0] - 1, rand_wall[1]])
-
-                        # Bottom cell
-                        if rand_wall[0] != height - 1:
-                            if maze[rand_wall[0] + 1][rand_wall[1]] != 'c':
-                                maze[rand_wall[0] + 1][rand_wall[1]] = 'w'
-                            if [rand_wall[0] + 1, rand_wall[1]] not in walls:
-                                walls.append([rand_wall[0] + 1, rand_wall[1]])
-
-                        # Leftmost cell
-                        if rand_wall[1] != 0:
-                            if maze[rand_wall[0]][rand_wall[1] - 1] != 'c':
-                                maze[rand_wall[0]][rand_wall[1] - 1] = 'w'
-                            if [rand_wall[0], rand_wall[1] - 1] not in walls:
-                                walls.append([rand_wall[0], rand_wall[1] - 1])
-
-                    # Delete wall
-                    for wall in walls:
-                        if wall[0] == rand_wall[0] and wall[1] == rand_wall[1]:
-                            walls.remove(wall)
-
-                    continue
-
-            # Check if it is an upper wall
-            if rand_wall[0] != 0:
-                if maze[rand_wall[0] - 1][rand_wall[1]] == 'u' and maze[rand_wall[0] + 1][rand_wall[1]] == 'c':
-
-                    s_cells = surroundingCells(rand_wall)
-                    if s_cells < 2:
-                        # Denote the new path
-                        maze[rand_wall[0]][rand_wall[1]] = 'c'
-
-                        # Mark the new walls
-                        # Upper cell
-                        if rand_wall[0] != 0:
-                            if maze[rand_wall[0] - 1][rand_wall[1]] != 'c':
-                                maze[rand_wall[0] - 1][rand_wall[1]] = 'w'
-                            if [rand_wall[0] - 1, rand_wall[1]] not in walls:
-                                walls.append([rand_wall[0] - 1, rand_wall[1]])
-
-                        # Leftmost cell
-                        if rand_wall[1] != 0:
-                            if maze[rand_wall[0]][rand_wall[1] - 1] != 'c':
-                                maze[rand_wall[0]][rand_wall[1] - 1] = 'w'
-                            if [rand_wall[0], rand_wall[1] - 1] not in walls:
-                                walls.append([rand_wall[0], rand_wall[1] - 1])
-
-                        # Rightmost cell
-                        if rand_wall[1] != width - 1:
-                            if maze[rand_wall[0]][rand_wall[1] + 1] != 'c':
-                                maze[rand_wall[0]][rand_wall[1] + 1] = 'w'
-                            if [rand_wall[0], rand_wall[1] + 1] not in walls:
-                                walls.append([rand_wall[0], rand_wall[1] + 1])
-
-                    # Delete wall
-                    for wall in walls:
-                        if wall[0] == rand_wall[0] and wall[1] == rand_wall[1]:
-                            walls.remove(wall)
-
-                    continue
-
-            # Check the bottom wall
-            if rand_wall[0] != height - 1:
-                if maze[rand_wall[0] + 1][rand_wall[1]] == 'u' and maze[rand_wall[0] - 1][rand_wall[1]] == 'c':
-
-                    s_cells = surroundingCells(rand_wall)
-                    if s_cells < 2:
-                        # Denote the new path
-                        maze[rand_wall[0]][rand_wall[1]] = 'c'
-
-                        # Mark the new walls
-                        if rand_wall[0] != height - 1:
-                            if maze[rand_wall[0] + 1][rand_wall[1]] != 'c':
-                                maze[rand_wall[0] + 1][rand_wall[1]] = 'w'
-                            if [rand_wall[0] + 1, rand_wall[1]] not in walls:
-                                walls.append([rand_wall[0] + 1, rand_wall[1]])
-                        if rand_wall[1] != 0:
-                            if maze[rand_wall[0]][rand_wall[1] - 1] != 'c':
-                                maze[rand_wall[0]][rand_wall[1] - 1] = 'w'
-                            if [rand_wall[0], rand_wall[1] - 1] not in walls:
-                                walls.append([rand_wall[0], rand_wall[1] - 1])
-                        if rand_wall[1] != width - 1:
-                            if maze[rand_wall[0]][rand_wall[1] + 1] != 'c':
-                                maze[rand_wall[0]][rand_wall[1] + 1] = 'w'
-                            if [rand_wall[0], rand_wall[1] + 1] not in walls:
-                                walls.append([rand_wall[0], rand_wall[1] + 1])
-
-                    # Delete wall
-                    for wall in walls:
-                        if wall[0] == rand_wall[0] and wall[1] == rand_wall[1]:
-                            walls.remove(wall)
-
-                    continue
-
-            # Check the right wall
-            if rand_wall[1] != width - 1:
-                if maze[rand_wall[0]][rand_wall[1] + 1] == 'u' and maze[rand_wall[0]][rand_wall[1] - 1] == 'c':
-
-                    s_cells = surroundingCells(rand_wall)
-                    if s_cells < 2:
-                        # Denote the new path
-                        maze[rand_wall[0]][rand_wall[1]] = 'c'
-
-                        # Mark the new walls
-                        if rand_wall[1] != width - 1:
-                            if maze[rand_wall[0]][rand_wall[1] + 1] != 'c':
-                                maze[rand_wall[0]][rand_wall[1] + 1] = 'w'
-                            if [rand_wall[0], rand_wall[1] + 1] not in walls:
-                                walls.append([rand_wall[0], rand_wall[1] + 1])
-                        if rand_wall[0] != height - 1:
-                            if maze[rand_wall[0] + 1][rand_wall[1]] != 'c':
-                                maze[rand_wall[0] + 1][rand_wall[1]] = 'w'
-                            if [rand_wall[0] + 1, rand_wall[1]] not in walls:
-                                walls.append([rand_wall[0] + 1, rand_wall[1]])
-                        if rand_wall[0] != 0:
-                            if maze[rand_wall[0] - 1][rand_wall[1]] != 'c':
-                                maze[rand_wall[0] - 1][rand_wall[1]] = 'w'
-                            if [rand_wall[0] - 1, rand_wall[1]] not in walls:
-                                walls.append([rand_wall[0] - 1, rand_wall[1]])
-
-                    # Delete wall
-                    for wall in walls:
-                        if wall[0] == rand_wall[0] and wall[1] == rand_wall[1]:
-                            walls.remove(wall)
-
-                    continue
-
-            # Delete the wall from the list anyway
-            for wall in walls:
-                if wall[0] == rand_wall[0] and wall[1] == rand_wall[1]:
-                    walls.remove(wall)
-
-        # Mark the remaining unvisited cells as walls
-        for i in range(0, height):
-            for j in range(0, width):
-                if maze[i][j] == 'u':
-                    maze[i][j] = 'w'
-
-        # Set entrance and exit
-        for i in range(0, width):
-            if maze[1][i] == 'c':
-                maze[0][i] = 'en'
-                break
-
-        for i in range(width - 1, 0, -1):
-            if maze[height - 2][i] == 'c':
-                maze[height - 1][i] = 'ex'
-                break
-
-        numerical_maze = []
-        for row in maze:
-            numerical_row = []
-            for cell in row:
-                if cell == 'w':
-                    numerical_row.append(numerical_wall_value)  # wall
-                elif cell == 'en':
-                    numerical_row.append(numerical_entrance_exit_value)
-                elif cell == 'ex':
-                    numerical_row.append(-numerical_entrance_exit_value)
-                else:
-                    numerical_row.append(numerical_corridor_value)  # corridor
-            numerical_maze.append(numerical_row)
-
-        return pd.DataFrame(numerical_maze)
+        self.entrance = self.get_value_location(entrance_exit_value)[0]
+        self.exit = self.get_value_location(-entrance_exit_value)[0]
+        self.exit_distance = self.exit_distance_field()
+        self.max_exit_distance = int(self.exit_distance.max())
+
+    def maze_generator(self, numerical_wall_value, numerical_corridor_value, numerical_entrance_exit_value,
+                       seed=None):
+        """A new random maze as an array of cell values (see generate_codes)"""
+        return cell_values(generate_codes(self.cols, self.rows, seed), numerical_wall_value,
+                           numerical_corridor_value, numerical_entrance_exit_value)
+
+    def exit_distance_field(self):
+        """BFS distances to the exit over the corridor, entrance and exit cells, as an int32 array"""
+        height, width = self.rows, self.cols
+        # One blocked cell of padding around the grid spares all bounds checks
+        stride = width + 2
+        open_cells = np.zeros((height + 2, stride), dtype=bool)
+        maze = self.maze
+        ee = self.entrance_exit_value
+        open_cells[1:-1, 1:-1] = (maze == self.corridor_value) | (maze == ee) | (maze == -ee)
+        passable = bytearray(open_cells.tobytes())
+        distance = array("l", [-1]) * len(passable)
+        start = (self.exit[1] + 1) * stride + self.exit[0] + 1
+        distance[start] = 0
+        passable[start] = 0
+        queue = deque([start])
+        pop, push = queue.popleft, queue.append
+        while queue:
+            p = pop()
+            d = distance[p] + 1
+            for q in (p - stride, p + stride, p - 1, p + 1):
+                if passable[q]:
+                    passable[q] = 0
+                    distance[q] = d
+                    push(q)
+        field = np.frombuffer(distance, dtype=np.dtype(distance.typecode)).reshape(height + 2, stride)
+        return field[1:-1, 1:-1].astype(np.int32)
+
+    def distance_to_exit(self, location):
+        """Steps from `location` to the exit, -1 if it is a wall, cut off or outside the maze"""
+        if not self.in_maze(location):
+            return -1
+        return int(self.exit_distance[location[1], location[0]])
 
     def get_value_location(self, value):
-        relevant_cells = []
-        for row in self.maze.index:
-            for col in self.maze.columns:
-                if self.maze[row][col] == value:
-                    relevant_cells.append((row, col))
-
-        return relevant_cells
+        """All the (x, y) locations holding `value`"""
+        return [(x, y) for y, x in np.argwhere(self.maze == value).tolist()]
 
     def update_explored(self, location):
         options = [self.corridor_value, self.agent_value, self.entrance_exit_value]
-        if self.maze[location[0]][location[1]] in options:
-            self.maze[location[0]][location[1]] = self.visited_value
+        if self.get_value(location) in options:
+            self.set_value(location, self.visited_value)
 
     def in_maze(self, location):
-        col = location[0]
-        row = location[1]
-
-        return col in self.maze.index and row in self.maze.columns
+        return 0 <= location[0] < self.cols and 0 <= location[1] < self.rows
 
     def get_value(self, location):
-        return self.maze[location[0]][location[1]]
+        return self.maze[location[1], location[0]]
+
+    def set_value(self, location, value):
+        self.maze[location[1], location[0]] = value
+
+    def to_string(self):
+        width = max(len(str(v)) for v in (self.wall_value, self.corridor_value, self.entrance_exit_value,
+                                          -self.entrance_exit_value, self.agent_value, self.visited_value))
+        return "\n".join(" ".join(str(v).rjust(width) for v in row) for row in self.maze.tolist())
 
 
 # maze_size = (10, 10)
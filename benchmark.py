@@ -0,0 +1,252 @@
+"""
+Benchmarks of the search, the games and the maze, with fixed seeds.
+Run this file to measure
+  - rollouts per second on tic-tac-toe from several positions,
+  - maze generation time and maze-search rollouts per second by grid size,
+  - bytes per tree node,
+  - move quality against a perfect tic-tac-toe solver and against the BFS
+    shortest path through each maze,
+and write the results to JSON. With `--baseline` the results are compared
+against an earlier run, metric by metric, and the exit status is 1 when
+any of them regressed by more than `--tolerance`.
+"""
+import argparse
+from collections import deque
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from monte_carlo_tree_search import MCTS, ArrayMCTS
+from tic_tac_toe import new_tic_tac_toe_board
+from find_a_path import MazeMCTS, start_a_maze
+from Maze_class import Maze
+from opening_book import OpeningBook
+
+SEED = 1234
+
+# Named starting positions, as the squares played alternately by X and O
+POSITIONS = {
+    "empty": (),
+    "center": (4,),
+    "corner": (0,),
+    "corner_center": (0, 4),
+    "fork_threat": (0, 4, 8),
+    "midgame": (4, 0, 2, 6),
+}
+
+# Metrics where a smaller value is the better one, by name suffix
+_LOWER_IS_BETTER = ("seconds", "bytes_per_node")
+
+
+def _board(moves):
+    board = new_tic_tac_toe_board()
+    for index in moves:
+        board = board.make_move(index)
+    return board
+
+
+def _timed_rollouts(tree, node, n_rollouts):
+    start = time.perf_counter()
+    for _ in range(n_rollouts):
+        tree.do_rollout(node)
+    return n_rollouts / (time.perf_counter() - start)
+
+
+def bench_tic_tac_toe(n_rollouts):
+    results = {}
+    for name, moves in POSITIONS.items():
+        board = _board(moves)
+        for tree_factory in (MCTS, ArrayMCTS):
+            random.seed(SEED)
+            rate = _timed_rollouts(tree_factory(), board, n_rollouts)
+            results[f"{name}.{tree_factory.__name__}.rollouts_per_second"] = rate
+    return results
+
+
+def bench_maze_generation(sizes, repeats):
+    results = {}
+    for size in sizes:
+        start = time.perf_counter()
+        for i in range(repeats):
+            Maze((size, size), wall_value='W', corridor_value=' ', visited_value='v', agent_value='A',
+                 entrance_exit_value=9, seed=SEED + i)
+        results[f"{size}x{size}.seconds"] = (time.perf_counter() - start) / repeats
+    return results
+
+
+def bench_maze_search(sizes, n_rollouts):
+    results = {}
+    for size in sizes:
+        random.seed(SEED)
+        state = start_a_maze((size, size), seed=SEED)
+        results[f"{size}x{size}.rollouts_per_second"] = _timed_rollouts(MazeMCTS(), state, n_rollouts)
+    return results
+
+
+def bench_memory(n_rollouts):
+    """
+    Bytes allocated per expanded node (as counted by `_tree_size`) by trees
+    grown from the empty tic-tac-toe board
+    """
+    results = {}
+    board = new_tic_tac_toe_board()
+    for tree_factory in (MCTS, ArrayMCTS):
+        random.seed(SEED)
+        tracemalloc.start()
+        tree = tree_factory()
+        for _ in range(n_rollouts):
+            tree.do_rollout(board)
+        allocated = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results[f"{tree_factory.__name__}.bytes_per_node"] = allocated / tree._tree_size()
+    return results
+
+
+def bench_tic_tac_toe_quality(n_positions, n_rollouts):
+    """Share of sampled positions where MCTS picks a move that keeps the perfect-play value"""
+    rng = random.Random(SEED)
+    positions = []
+    while len(positions) < n_positions:
+        board = new_tic_tac_toe_board()
+        for _ in range(rng.randrange(8)):
+            if board.terminal:
+                break
+            board = board.find_random_child()
+        if not board.terminal:
+            positions.append(board)
+    book = OpeningBook.build()
+    results = {}
+    for tree_factory in (MCTS, ArrayMCTS):
+        random.seed(SEED)
+        optimal = 0
+        for board in positions:
+            tree = tree_factory()
+            for _ in range(n_rollouts):
+                tree.do_rollout(board)
+            optimal += board.move_to(tree.choose(board)) in book.best_moves(board)
+        results[f"{tree_factory.__name__}.optimal_move_rate"] = optimal / n_positions
+    return results
+
+
+def shortest_path_length(maze):
+    """Number of steps of the shortest path from the entrance to the exit, None if there is none"""
+    passable = {maze.corridor_value, -maze.entrance_exit_value}
+    distance = {maze.entrance: 0}
+    queue = deque([maze.entrance])
+    while queue:
+        x, y = position = queue.popleft()
+        if position == maze.exit:
+            return distance[position]
+        for neighbour in ((x, y + 1), (x, y - 1), (x - 1, y), (x + 1, y)):
+            if (neighbour not in distance and maze.in_maze(neighbour)
+                    and maze.get_value(neighbour) in passable):
+                distance[neighbour] = distance[position] + 1
+                queue.append(neighbour)
+    return None
+
+
+def bench_maze_quality(sizes, n_mazes, rollouts_per_move):
+    """
+    Share of mazes where the searched walk reaches the exit, and the mean of
+    the BFS shortest path length over the walk length (1 for a shortest
+    walk, 0 for a walk that gets stuck)
+    """
+    results = {}
+    for size in sizes:
+        random.seed(SEED)
+        solved, efficiency = 0, 0.0
+        for i in range(n_mazes):
+            state = start_a_maze((size, size), seed=SEED + i)
+            shortest = shortest_path_length(state.maze)
+            tree = MazeMCTS()
+            steps = 0
+            while not state.is_terminal():
+                for _ in range(rollouts_per_move):
+                    tree.do_rollout(state)
+                state = tree.choose(state)
+                steps += 1
+            if state.finished and shortest:
+                solved += 1
+                efficiency += shortest / steps
+        results[f"{size}x{size}.solved_rate"] = solved / n_mazes
+        results[f"{size}x{size}.path_efficiency"] = efficiency / n_mazes
+    return results
+
+
+def run(quick=False):
+    scale = 10 if quick else 1
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": SEED,
+            "quick": quick,
+        },
+        "tic_tac_toe": bench_tic_tac_toe(5000 // scale),
+        "maze_generation": bench_maze_generation((50, 200) if quick else (50, 200, 500, 1000), 3),
+        "maze_search": bench_maze_search((10, 30) if quick else (10, 30, 100), 2000 // scale),
+        "memory": bench_memory(5000 // scale),
+        "tic_tac_toe_quality": bench_tic_tac_toe_quality(8 if quick else 40, 400),
+        "maze_quality": bench_maze_quality((8, 12) if quick else (8, 12, 20), 2 if quick else 10, 100),
+    }
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Rows of (metric, baseline, current, relative change, regressed) for the
+    metrics present in both runs. The change is positive when the metric
+    improved, whichever way it is better.
+    """
+    rows = []
+    for group, metrics in results.items():
+        if group == "meta":
+            continue
+        for name, current in metrics.items():
+            before = baseline.get(group, {}).get(name)
+            if before is None:
+                continue
+            if before:
+                change = (current - before) / abs(before)
+            else:
+                change = 0.0 if current == before else float("inf")
+            if name.endswith(_LOWER_IS_BETTER):
+                change = -change
+            rows.append((f"{group}.{name}", before, current, change, change < -tolerance))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", "-o", default="benchmark.json", help="where to write the results")
+    parser.add_argument("--baseline", "-b", help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative change counted as a regression (default 0.1)")
+    parser.add_argument("--quick", action="store_true", help="smaller workloads, for a smoke test")
+    args = parser.parse_args(argv)
+
+    results = run(quick=args.quick)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"results written to {args.output}")
+
+    if args.baseline is None:
+        for group, metrics in results.items():
+            if group != "meta":
+                for name, value in metrics.items():
+                    print(f"{group + '.' + name:<60} {value:14.4f}")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = 0
+    for metric, before, current, change, regressed in compare(results, baseline, args.tolerance):
+        regressions += regressed
+        flag = "REGRESSED" if regressed else ""
+        print(f"{metric:<60} {before:14.4f} {current:14.4f} {change:+8.1%} {flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
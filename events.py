@@ -0,0 +1,135 @@
+"""
+Structured events from the search and the environments.
+MCTS and AgentInMaze report what they do as typed events to an observer
+(a sink). The default NULL_SINK is disabled, and every emitting call site
+checks `observer.enabled` before even building the event, so a quiet run
+pays nothing for it. TextSink, JsonlSink and ProgressSink are opt-in, and
+any sink can keep only one in `every` events of each type. ProgressSink
+needs tqdm, which is only imported when one is created.
+"""
+from collections import Counter, namedtuple
+import json
+import sys
+import time
+
+Move = namedtuple("Move", "position new_position stuck finished")  # an agent stepped
+Expand = namedtuple("Expand", "node n_children")  # the tree added the children of a node
+RolloutFinished = namedtuple("RolloutFinished", "depth reward")  # a rollout was backpropagated
+ChoiceMade = namedtuple("ChoiceMade", "node choice")  # the tree chose a move
+
+_JSON_SCALARS = (bool, int, float, str, type(None))
+
+
+class NullSink:
+    """Observer that ignores everything"""
+    enabled = False
+
+    def emit(self, event):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_SINK = NullSink()
+
+
+class Sink:
+    """
+    Base of the enabled sinks. Keeps one in `every` events of each type,
+    only of the types in `kinds` if given, and passes them to `handle`.
+    """
+    enabled = True
+
+    def __init__(self, every=1, kinds=None):
+        self.every = every
+        self.kinds = None if kinds is None else tuple(kinds)
+        self._counts = Counter()
+
+    def emit(self, event):
+        kind = type(event)
+        if self.kinds is not None and kind not in self.kinds:
+            return
+        count = self._counts[kind]
+        self._counts[kind] = count + 1
+        if count % self.every == 0:
+            self.handle(event)
+
+    def handle(self, event):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class TextSink(Sink):
+    """One human-readable line per event"""
+    def __init__(self, stream=None, every=1, kinds=None):
+        super().__init__(every, kinds)
+        self.stream = stream if stream is not None else sys.stdout
+
+    def handle(self, event):
+        fields = ", ".join(f"{name}={value}" for name, value in zip(event._fields, event))
+        print(f"{type(event).__name__}: {fields}", file=self.stream)
+
+
+class JsonlSink(Sink):
+    """One JSON object per line, with the event type and a timestamp"""
+    def __init__(self, path_or_file, every=1, kinds=None):
+        super().__init__(every, kinds)
+        self._owned = isinstance(path_or_file, str)
+        self.file = open(path_or_file, "a") if self._owned else path_or_file
+
+    def handle(self, event):
+        record = {"event": type(event).__name__, "time": time.time()}
+        for name, value in zip(event._fields, event):
+            if isinstance(value, tuple) and all(isinstance(v, _JSON_SCALARS) for v in value):
+                value = list(value)  # e.g. a position
+            elif not isinstance(value, _JSON_SCALARS):
+                value = repr(value)
+            record[name] = value
+        self.file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        if self._owned:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+class ProgressSink(Sink):
+    """A tqdm progress bar of the rollouts, restarted after every choice"""
+    def __init__(self, total=None, every=1):
+        from tqdm.auto import tqdm  # optional, only needed for a progress bar
+        super().__init__(every, (RolloutFinished, ChoiceMade))
+        self.tqdm = tqdm
+        self.total = total
+        self.bar = None
+
+    def handle(self, event):
+        if isinstance(event, ChoiceMade):
+            self.close()
+            return
+        if self.bar is None:
+            self.bar = self.tqdm(total=self.total, unit="rollout")
+        self.bar.update(self.every)
+
+    def close(self):
+        if self.bar is not None:
+            self.bar.close()
+            self.bar = None
+
+
+class MultiSink:
+    """Forwards every event to several sinks"""
+    def __init__(self, *sinks):
+        self.sinks = sinks
+        self.enabled = any(sink.enabled for sink in sinks)
+
+    def emit(self, event):
+        for sink in self.sinks:
+            sink.emit(event)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
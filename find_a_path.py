@@ -1,147 +1,96 @@
 from Maze_class import Maze
-from tqdm.auto import tqdm
-from random import choice
-import math
-from abc import ABC, abstractmethod
-from collections import defaultdict
-import numpy as np
-
-
-class MCTS:
-    """Monte Carlo tree searcher. First rollout the tree then choose a move."""
-
-    def __init__(self, exploration_weight=1):
-        self.Q = defaultdict(int)  # total reward of each node
-        self.N = defaultdict(int)  # total visit count for each node
-        self.children = dict()  # children of each node
-        self.exploration_weight = exploration_weight
-
-    def choose(self, node):
-        """Choose the best successor of node. (Choose a move in the game)"""
-        if node.is_terminal():
-            raise RuntimeError(f"choose called on terminal node {node}")
-
-        if node not in self.children:
-            return node.find_random_child()
-
-        def score(n):
-            if self.N[n] == 0:
-                return float("-inf")  # avoid unseen moves
-            return self.Q[n] / self.N[n]  # average reward
-
-        return max(self.children[str(node.step_history)], key=score)
-
-    def do_rollout(self, node):  # Node is an agent state in a maze
-        """Make the tree one layer better. (Train for one iteration.)"""
-        path = self._select(node)
-        leaf = path[-1]
-        self._expand(leaf)
-        reward = self._simulate(leaf)
-        self._backpropagate(path, reward)
-
-    def _select(self, node):
-        """Find an unexplored descendent of `node`"""
-        path = []
-        while True:
-            path.append(node)
-            if str(node.step_history) not in self.children or node.stuck:  # if the node itself is unexplored
-                # the node's unique "name" is not in the tree's children or if the node is stuck
-                return path
-            unexplored = list(self.children.keys())
-            unexplored.remove(str(node.step_history))
-            if len(unexplored) > 0:
-                n = unexplored.pop()
-                path.append(n)
-                return path
-            node = self._uct_select(node)  # descend a layer deeper
-
-    def _expand(self, node):
-        """Update the `children` dict with the children of `node`"""
-        if node is None:
-            return
-        if str(node.step_history) in self.children:
-            return  # already expanded
-        node.maze.update_explored(node.current_position)  # Update visited cell
-        node.step(node.current_position, True)  # Update agent steps
-        nodeee = node.find_children()
-        self.children[str(node.step_history)] = nodeee
-
-    def _simulate(self, node):
-        """Returns the reward for a random simulation (to completion) of `node`"""
-        while True:
-            if node.finished or node.stuck:
-                return node.reward()
-            node = node.find_random_child()  # node.find_children()
-
-    def _backpropagate(self, path, reward):
-        """Send the reward back up to the ancestors of the leaf"""
-        for node in reversed(path):
-            self.N[str(node.step_history)] += 1
-            self.Q[str(node.step_history)] += reward
-
-    def _uct_select(self, node):
-        """Select a child of node, balancing exploration & exploitation"""
-
-        # All children of node should already be expanded:
-        assert all(n in self.children for n in self.children[str(node.step_history)])
+from monte_carlo_tree_search import MCTS, Node
+from events import NULL_SINK, Move
+import random
 
-        log_N_vertex = math.log(self.N[str(node.step_history)])
+_MASK_64 = (1 << 64) - 1
 
-        def uct(n):
-            """Upper confidence bound for trees"""
-            return self.Q[n] / self.N[n] + self.exploration_weight * math.sqrt(
-                log_N_vertex / self.N[n]
-            )
 
-        return max(self.children[str(node.step_history)], key=uct)
-
-
-class Node(ABC):
+class MazeMCTS(MCTS):
     """
-    A representation of a single board state.
-    MCTS works by constructing a tree of these Nodes.
-    Could be e.g. a chess or checkers board state.
+    Monte Carlo tree searcher for a single agent in a maze.
+    There is no opponent, so rewards are never inverted between steps.
     """
+    invert_rewards = False
 
-    @abstractmethod
-    def find_children(self):
-        """All possible successors of this board state"""
-        return set()
 
-    @abstractmethod
-    def find_random_child(self):
-        """Random successor of this board state (for more efficient simulation)"""
-        return None
+def _zobrist(feature):
+    """Pseudo-random 64-bit key of a feature (splitmix64), in place of a Zobrist table"""
+    z = (feature * 0x9E3779B97F4A7C15 + 0x9E3779B97F4A7C15) & _MASK_64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK_64
+    return z ^ (z >> 31)
 
-    @abstractmethod
-    def is_terminal(self):
-        """Returns True if the node has no children"""
-        return True
 
-    @abstractmethod
-    def reward(self):
-        """Assumes `self` is terminal node. 1=win, 0=loss, .5=tie, etc"""
-        return 0
+_STUCK_KEY = _zobrist(-1)
+# The visited cells are kept in a persistent radix trie over flat cell
+# indices: leaves are bitsets of 64 cells, inner nodes tuples of 32
+# subtries, and None stands for an empty subtrie. A step copies only the
+# nodes on the way to one leaf, at most 3 of them up to 2 million cells.
+_LEAF_BITS = 6
+_FANOUT_BITS = 5
+_FANOUT_MASK = (1 << _FANOUT_BITS) - 1
+_EMPTY_NODE = (None,) * (1 << _FANOUT_BITS)
+# Direction of each step, as in AgentInMaze.get_a_step
+_DIRECTIONS = {(0, 1): 'up', (0, -1): 'down', (-1, 0): 'left', (1, 0): 'right'}
 
-    @abstractmethod
-    def __hash__(self):
-        """Nodes must be hashable"""
-        return 123456789
 
-    @abstractmethod
-    def __eq__(node1, node2):
-        """Nodes must be comparable"""
-        return True
+def _trie_levels(cells):
+    """Inner levels of a visited trie covering flat cell indices below `cells`"""
+    bits = max((cells - 1).bit_length() - _LEAF_BITS, 0)
+    return -(-bits // _FANOUT_BITS)
 
 
-def start_a_maze(maze_size):
+def _trie_contains(trie, levels, cell):
+    shift = _LEAF_BITS + _FANOUT_BITS * levels
+    for _ in range(levels):
+        if trie is None:
+            return False
+        shift -= _FANOUT_BITS
+        trie = trie[cell >> shift & _FANOUT_MASK]
+    return trie is not None and trie >> (cell & 63) & 1 == 1
+
+
+def _trie_add(trie, levels, cell):
+    """`trie` with `cell` added, sharing every node off the path to its leaf"""
+    shift = _LEAF_BITS + _FANOUT_BITS * levels
+    path = []
+    for _ in range(levels):
+        node = _EMPTY_NODE if trie is None else trie
+        shift -= _FANOUT_BITS
+        i = cell >> shift & _FANOUT_MASK
+        path.append((node, i))
+        trie = node[i]
+    trie = (trie or 0) | 1 << (cell & 63)
+    for node, i in reversed(path):
+        trie = node[:i] + (trie,) + node[i + 1:]
+    return trie
+
+
+def start_a_maze(maze_size, seed=None, observer=NULL_SINK, codes=None):
+    """An agent at the entrance of a new maze, or of the maze given by its cell `codes` (see maze_file)"""
     return AgentInMaze(maze=Maze(maze_size, wall_value='W', corridor_value=' ', visited_value='v',
-                                 agent_value='A', entrance_exit_value=9),
-                       finished=False, stuck=False, step_history=[], current_position=None)
+                                 agent_value='A', entrance_exit_value=9, seed=seed, codes=codes),
+                       finished=False, stuck=False, current_position=None, observer=observer)
+
 
+class AgentInMaze(Node):
+    """
+    Immutable state of the agent in a maze: its position, the cells it has
+    visited as a persistent trie over flat cell indices (shared with its
+    ancestors, so a step costs the same in a maze of any size), their
+    count, and a Zobrist-style hash of both that every step updates
+    incrementally. All the states of a search share one Maze, which they
+    only read, so sibling branches never interfere and hashing a state costs
+    the same at any path length.
+    Every move is reported to `observer` (see events.py), which is passed
+    on to the children and by default ignores it.
+    """
+    __slots__ = ('maze', 'finished', 'stuck', 'current_position', 'visited', 'n_visited', 'key', 'parent',
+                 'observer')
 
-class AgentInMaze:
-    def __init__(self, maze, finished, stuck, step_history, current_position):
+    def __init__(self, maze, finished, stuck, current_position, visited=None, key=None, parent=None,
+                 observer=NULL_SINK, n_visited=1):
         self.maze = maze
         self.finished = finished
         self.stuck = stuck
@@ -149,10 +98,40 @@ class AgentInMaze:
             self.current_position = self.maze.entrance
         else:
             self.current_position = current_position
-        self.step_history = step_history
+        if visited is None:  # a fresh agent has visited the cell it stands on
+            cell = self.cell(self.current_position)
+            visited = _trie_add(None, self._levels(), cell)
+            key = _zobrist(2 * cell) ^ _zobrist(2 * cell + 1)
+            n_visited = 1
+        self.visited = visited  # trie of the visited flat cell indices
+        self.n_visited = n_visited
+        self.key = key  # xor of the keys of the visited cells and of the position
+        self.parent = parent  # state this one stepped from
+        self.observer = observer
+
+    def cell(self, position):
+        """Flat index of the cell at (x, y)"""
+        return position[1] * self.maze.cols + position[0]
+
+    def _levels(self):
+        return _trie_levels(self.maze.cols * self.maze.rows)
+
+    def has_visited(self, position):
+        """True if the agent has visited the cell at (x, y)"""
+        return _trie_contains(self.visited, self._levels(), self.cell(position))
+
+    @property
+    def step_history(self):
+        """Positions the agent has walked through before its current one"""
+        history = []
+        state = self.parent
+        while state is not None:
+            history.append(state.current_position)
+            state = state.parent
+        return history[::-1]
 
     def find_children(self):
-        if self.stuck:  # If the game is finished then no moves can be made
+        if self.is_terminal():  # If the game is finished then no moves can be made
             return set()
         # Otherwise, you can make a move in each of the empty spots
         possible_directions = {'up': None, 'down': None, 'left': None, 'right': None}
@@ -162,34 +141,72 @@ class AgentInMaze:
             if self.maze.in_maze(new_position):
                 possible_directions[step_direction] = self.make_move(current_position, new_position)
             else:
-                possible_directions[step_direction] = AgentInMaze(maze=self.maze, finished=False, stuck=True,
-                                                                  step_history=self.step_history,
-                                                                  current_position=new_position)
+                possible_directions[step_direction] = self._step(new_position, finished=False, stuck=True)
 
         return set(possible_directions.values())
 
-    def find_random_child(self):
+    def iter_children(self):
+        """The children of find_children, each one built only when asked for"""
+        if self.is_terminal():
+            return
+        directions = ['up', 'down', 'left', 'right']
+        random.shuffle(directions)
+        for step_direction in directions:
+            new_position = self.get_a_step(step_direction, self.current_position)
+            if self.maze.in_maze(new_position):
+                yield self.make_move(self.current_position, new_position)
+            else:
+                yield self._step(new_position, finished=False, stuck=True)
+
+    def find_random_child(self, rng=random):
         if self.stuck:
             return self  # If the game is finished then no moves can be made
         possible_directions = {'up': None, 'down': None, 'left': None, 'right': None}
         empty_spots = []
         for direction in possible_directions:
             new_position = self.get_a_step(direction, self.current_position)
-            if self.maze.in_maze(new_position):
-                if self.maze.get_value(new_position) is self.maze.corridor_value:
-                    empty_spots.append(new_position)
-
-        empty_spots += self.maze.get_value_location(self.maze.visited_value)
-        return self.make_move(self.current_position, choice(empty_spots))
+            if self.maze.in_maze(new_position) and not self.is_stuck(new_position):
+                empty_spots.append(new_position)
+
+        # Besides the free neighbours, the walk may pick any visited cell,
+        # which gets it stuck. It then stays where it stands.
+        k = rng.randrange(len(empty_spots) + self.n_visited)
+        if k < len(empty_spots):
+            return self.make_move(self.current_position, empty_spots[k])
+        return self._step(self.current_position, finished=False, stuck=True)
+
+    def find_guided_child(self, rng=random, greed=0.75):
+        """
+        With probability `greed` the free neighbour nearest to the exit,
+        otherwise a random child as from `find_random_child`
+        """
+        if self.stuck or rng.random() >= greed:
+            return self.find_random_child(rng)
+        best, best_distance = None, None
+        for direction in ('up', 'down', 'left', 'right'):
+            new_position = self.get_a_step(direction, self.current_position)
+            if self.maze.in_maze(new_position) and not self.is_stuck(new_position):
+                distance = self.maze.distance_to_exit(new_position)
+                if distance >= 0 and (best is None or distance < best_distance):
+                    best, best_distance = new_position, distance
+        if best is None:
+            return self.find_random_child(rng)
+        return self.make_move(self.current_position, best)
 
     def reward(self):
+        """1 at the exit, otherwise closer to 1 the fewer steps are left to the exit"""
         if self.finished:
-            return 0
-        else:
-            return self.calc_distance_to_exit()
+            return 1
+        return 1 - self.calc_distance_to_exit() / (self.maze.max_exit_distance + 1)
 
     def is_terminal(self):
-        return self.stuck
+        return self.stuck or self.finished
+
+    def move_to(self, child):
+        """The direction of the step to `child`, None if the agent got stuck where it stood"""
+        dx = child.current_position[0] - self.current_position[0]
+        dy = child.current_position[1] - self.current_position[1]
+        return _DIRECTIONS.get((dx, dy))
 
     def get_a_step(self, step, current_position):
         if step == 'up':
@@ -209,31 +226,47 @@ class AgentInMaze:
         if finished:
             stuck = False
         else:
-            stuck = self.is_stuck(self.maze.maze, new_position)
-
-        # If it's possible to move in the new direction of if the new position is the exit cell.
-        if self.maze.get_value(new_position) == self.maze.corridor_value or new_position == self.maze.exit:
-            new_state = self.maze
-            new_state.maze[new_position[0]][new_position[1]] = self.maze.agent_value
+            stuck = self.is_stuck(new_position)
 
-        else:
-            new_state = self.maze
+        new_state = self._step(new_position, finished, stuck)
+        if self.observer.enabled:
+            self.observer.emit(Move(current_position, new_position, stuck, finished))
 
-        print(f'\nCurrent position: {current_position}, new position: {new_position}, is stuck: {stuck}, '
-              f'has finished: {finished}')
-        print(f'Agent path: {self.step_history}')
-        print(f'{self.maze.maze}\n')
+        return new_state
 
-        return AgentInMaze(maze=new_state, finished=finished, stuck=stuck,
-                           step_history=self.step_history, current_position=new_position)
+    def _step(self, new_position, finished, stuck):
+        """The state after stepping to `new_position`, which becomes visited unless the agent is stuck"""
+        visited, n_visited, key = self.visited, self.n_visited, self.key
+        new_cell = self.cell(new_position)
+        key ^= _zobrist(2 * self.cell(self.current_position) + 1) ^ _zobrist(2 * new_cell + 1)
+        if stuck:
+            key ^= _STUCK_KEY
+        else:
+            visited = _trie_add(visited, self._levels(), new_cell)
+            n_visited += 1
+            key ^= _zobrist(2 * new_cell)
+        return AgentInMaze(maze=self.maze, finished=finished, stuck=stuck, current_position=new_position,
+                           visited=visited, key=key, parent=self, observer=self.observer,
+                           n_visited=n_visited)
 
     def to_pretty_string(self):
-        return f'\nCurrent state: \n{self.maze.maze}\n'
-
-    def is_stuck(self, environment, new_position):
-        destination = environment.loc[new_position[0]][new_position[1]]
+        maze = self.maze
+        grid = maze.maze.copy()
+        visited = grid.ravel()  # a view, to mark cells by flat index
+        levels = self._levels()
+        for cell in range(len(visited)):
+            if visited[cell] == maze.corridor_value and _trie_contains(self.visited, levels, cell):
+                visited[cell] = maze.visited_value
+        if maze.in_maze(self.current_position):
+            grid[self.current_position[1], self.current_position[0]] = maze.agent_value
+        width = max(len(str(v)) for v in visited.tolist())
+        rows = "\n".join(" ".join(str(v).rjust(width) for v in row) for row in grid.tolist())
+        return f'\nCurrent state: \n{rows}\n'
+
+    def is_stuck(self, new_position):
+        destination = self.maze.get_value(new_position)
         good_options = [self.maze.corridor_value, -self.maze.entrance_exit_value]
-        if destination not in good_options:
+        if destination not in good_options or self.has_visited(new_position):
             return True
         else:
             return False
@@ -241,19 +274,53 @@ class AgentInMaze:
     def is_finished(self, new_position):
         return new_position == self.maze.exit
 
-    def step(self, new_position, make_a_step):
-        self.step_history.append(self.current_position)
-        if make_a_step:
-            self.current_position = new_position
-
     def calc_distance_to_exit(self):
-        current_position = np.array(self.current_position)
-        exit_position = np.array(self.maze.exit)
-        return math.sqrt(sum((current_position - exit_position)**2))
+        """
+        Steps left to the exit along the corridors. A state stuck against a
+        wall or the border is as far as the cell it tried to step from.
+        """
+        state = self
+        distance = self.maze.distance_to_exit(self.current_position)
+        while distance < 0 and state.parent is not None:
+            state = state.parent
+            distance = self.maze.distance_to_exit(state.current_position)
+        return distance if distance >= 0 else self.maze.max_exit_distance
+
+    def __repr__(self):
+        return (f'AgentInMaze(current_position={self.current_position}, finished={self.finished}, '
+                f'stuck={self.stuck})')
 
+    def __hash__(self):
+        return self.key
 
-def find_path():
-    tree = MCTS()
+    def __eq__(self, other):
+        return (self.key == other.key and self.n_visited == other.n_visited and self.visited == other.visited
+                and self.current_position == other.current_position
+                and self.finished == other.finished and self.stuck == other.stuck)
+
+
+class GuidedRollout:
+    """
+    Rollout policy biased toward the exit by the maze's distance field: each
+    step of the playout is `find_guided_child`. Use it as
+    `MazeMCTS(simulator=GuidedRollout())`.
+    """
+    def __init__(self, greed=0.75, seed=None):
+        self.greed = greed
+        self.rng = random.Random(seed)
+
+    def __call__(self, node):
+        while not node.is_terminal():
+            node = node.find_guided_child(self.rng, self.greed)
+        return node.reward()
+
+
+def find_path(observer=NULL_SINK, guided=False):
+    """
+    Walk a maze, with e.g. events.ProgressSink(50) as `observer` to follow
+    the search, and rollouts guided toward the exit if `guided`
+    """
+    tree = MazeMCTS(observer=observer, simulator=GuidedRollout() if guided else None)
     bad_input = True
     while bad_input:
         maze_rows = 4  # input("Please enter the number of rows in the maze (int): ")
@@ -265,15 +332,15 @@ def find_path():
         except ValueError:
             bad_input = True
 
-    agent_state = start_a_maze(maze_size)
+    agent_state = start_a_maze(maze_size, observer=observer)
     print(agent_state.to_pretty_string())
 
     while True:
-        for _ in tqdm(range(50)):
+        for _ in range(50):
             tree.do_rollout(agent_state)
         agent_state = tree.choose(agent_state)
         print(agent_state.to_pretty_string())
-        if agent_state.stuck:
+        if agent_state.is_terminal():
             break
 
 
@@ -0,0 +1,386 @@
+"""
+Many games served from one process with asyncio.
+A GameService holds any number of sessions, each a board and its own
+search tree. Search requests never block the event loop for long: a single
+scheduler task grows the trees of all the sessions that are thinking in
+short time slices, round-robin. Within a round each session gets the time
+left to its deadline divided among the sessions not yet served in that
+round, so every thinking session gets an equal share of the CPU. A
+session is answered as soon as its rollout budget is spent or its deadline
+is one slice away; deadlines are kept in a heap and checked before every
+slice, so however many sessions are thinking, an answer is at most about
+one slice late. The slices can also be run in an executor (a thread pool)
+to keep the event loop free while they run.
+The front end is a line-based protocol, over TCP or stdin/stdout:
+    NEW tictactoe | NEW mnk M N K       -> OK <sid>
+    MOVE <sid> <square> [deadline_ms]   -> MOVE <sid> <square> <state> <rollouts>
+        (plays the square, then answers with the engine's reply)
+    GO <sid> [deadline_ms]              -> MOVE <sid> <square> <state> <rollouts>
+        (the engine moves, e.g. to open the game)
+    SHOW <sid>                          -> BOARD <sid> <rows separated by |>
+    CLOSE <sid>                         -> OK <sid>
+    STATS                               -> STATS sessions=<n> thinking=<n> rollouts=<n>
+where <state> is PLAYING, X, O (the winner) or DRAW. A game that the human
+move ends is answered with `OK <sid> <state>`, and errors with `ERR <reason>`.
+Requests are handled concurrently, so the answers of different sessions may
+come back in any order; every answer names its session.
+"""
+import argparse
+import asyncio
+from collections import deque
+import heapq
+from itertools import count
+import sys
+import time
+
+from monte_carlo_tree_search import ArrayMCTS
+from tic_tac_toe import new_tic_tac_toe_board
+from mnk_game import new_mnk_board
+
+GAMES = {
+    "tictactoe": new_tic_tac_toe_board,
+    "mnk": lambda m, n, k: new_mnk_board(int(m), int(n), int(k)),
+}
+
+
+class SearchRequest:
+    """A pending engine move: its deadline, rollout budget and the future of the answer"""
+    def __init__(self, deadline, max_rollouts, future):
+        self.deadline = deadline
+        self.max_rollouts = max_rollouts
+        self.future = future
+        self.rollouts = 0
+
+
+class GameSession:
+    def __init__(self, sid, board, tree):
+        self.sid = sid
+        self.board = board
+        self.tree = tree
+        self.request = None  # the SearchRequest being served, if thinking
+
+
+class GameService:
+    """
+    Sessions and their fair search scheduler. Call `start` from a running
+    event loop (or use the service as an async context manager) before
+    sending requests.
+    """
+    def __init__(self, slice_seconds=0.005, default_deadline=1.0, executor=None, tree_factory=ArrayMCTS,
+                 max_sessions=None):
+        self.slice_seconds = slice_seconds
+        self.default_deadline = default_deadline
+        self.executor = executor
+        self.tree_factory = tree_factory
+        self.max_sessions = max_sessions
+        self.sessions = dict()
+        self.rollouts = 0  # total over all sessions
+        self._ids = count(1)
+        self._thinking = deque()  # round-robin queue of (session, request) being searched
+        self._round_left = 0  # entries of the queue not yet served in the current round
+        self._gap = 0.0  # running mean of the time lost between two slices, overruns included
+        self._slice_end = None  # when the last slice was due to end, None after idling
+        self._deadlines = []  # heap of (deadline, sequence number, session, request)
+        self._sequence = count()
+        self._wakeup = asyncio.Event()
+        self._scheduler = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def start(self):
+        self._scheduler = asyncio.create_task(self._schedule())
+
+    async def stop(self):
+        self._scheduler.cancel()
+        try:
+            await self._scheduler
+        except asyncio.CancelledError:
+            pass
+        for session in list(self.sessions.values()):
+            self.close(session.sid)
+
+    def new_session(self, game="tictactoe", *args):
+        if self.max_sessions is not None and len(self.sessions) >= self.max_sessions:
+            raise RuntimeError("too many sessions")
+        if game not in GAMES:
+            raise ValueError(f"unknown game {game!r}")
+        sid = str(next(self._ids))
+        self.sessions[sid] = GameSession(sid, GAMES[game](*args), self.tree_factory())
+        return sid
+
+    def close(self, sid):
+        session = self._session(sid)
+        request = session.request
+        if request is not None:
+            session.request = None
+            if not request.future.done():  # answer the pending think with an error
+                request.future.set_exception(RuntimeError(f"session {sid} was closed"))
+        del self.sessions[sid]
+
+    def _session(self, sid):
+        try:
+            return self.sessions[sid]
+        except KeyError:
+            raise ValueError(f"no session {sid}") from None
+
+    def play(self, sid, index):
+        """Play the human's move on the square `index`"""
+        session = self._session(sid)
+        if session.request is not None:
+            raise RuntimeError(f"session {sid} is thinking")
+        if session.board.is_terminal():
+            raise RuntimeError(f"game {sid} is over")
+        board = session.board
+        if index not in {board.move_to(child) for child in board.find_children()}:
+            raise ValueError(f"square {index} is not an empty square")
+        session.board = board.make_move(index)
+        session.tree.reroot(session.board)  # forget the branches the game can no longer reach
+        return session.board
+
+    async def think(self, sid, deadline=None, max_rollouts=None):
+        """
+        Search the board of session `sid` until `deadline` seconds from now
+        (the service default if None) or `max_rollouts` rollouts, then play
+        the engine's move. Returns the square played and the rollouts used.
+        """
+        session = self._session(sid)
+        if session.request is not None:
+            raise RuntimeError(f"session {sid} is already thinking")
+        if session.board.is_terminal():
+            raise RuntimeError(f"game {sid} is over")
+        if deadline is None:
+            deadline = self.default_deadline
+        future = asyncio.get_running_loop().create_future()
+        request = session.request = SearchRequest(time.perf_counter() + deadline, max_rollouts, future)
+        heapq.heappush(self._deadlines, (request.deadline, next(self._sequence), session, request))
+        self._thinking.append((session, request))
+        self._wakeup.set()
+        return await future
+
+    async def _schedule(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._thinking:
+                self._wakeup.clear()
+                self._slice_end = None
+                await self._wakeup.wait()
+                continue
+            now = time.perf_counter()
+            if self._slice_end is not None:
+                self._gap += 0.1 * (max(now - self._slice_end, 0.0) - self._gap)
+            while self._deadlines and self._deadlines[0][0] <= now + self.slice_seconds:
+                _, _, session, request = heapq.heappop(self._deadlines)
+                if session.request is request:
+                    self._answer(session)
+            if self._round_left <= 0:
+                self._round_left = len(self._thinking)
+            session, request = self._thinking.popleft()
+            self._round_left -= 1
+            if session.request is not request:
+                continue  # answered or closed meanwhile
+            if request.max_rollouts is not None and request.rollouts >= request.max_rollouts:
+                self._answer(session)
+                continue
+            # A fair share of the time left to the deadline among this session and
+            # the ones still to be served this round, less the time lost between
+            # their slices (to scheduling, and to the last rollout of a slice
+            # running over), so that all of them get the same time even when
+            # overloaded
+            left = request.deadline - self.slice_seconds - now - self._gap * self._round_left
+            share = left / (self._round_left + 1)
+            until = now + min(self.slice_seconds, share)
+            if self.executor is None:
+                n = self._run_slice(session, until)
+            else:
+                n = await loop.run_in_executor(self.executor, self._run_slice, session, until)
+            request.rollouts += n
+            self.rollouts += n
+            if session.request is request:
+                self._thinking.append((session, request))
+            self._slice_end = until
+            await asyncio.sleep(0)  # let the connections in between slices
+
+    def _run_slice(self, session, until):
+        """Rollouts on the session's board until `until` or its rollout budget, at least one"""
+        request, tree, board = session.request, session.tree, session.board
+        budget = None if request.max_rollouts is None else request.max_rollouts - request.rollouts
+        n = 0
+        while True:
+            tree.do_rollout(board)
+            n += 1
+            if n == budget or time.perf_counter() >= until:
+                return n
+
+    def _answer(self, session):
+        request = session.request
+        board = session.board
+        choice = session.tree.choose(board)
+        session.board = choice
+        session.tree.reroot(choice)
+        session.request = None
+        if not request.future.done():
+            request.future.set_result((board.move_to(choice), request.rollouts))
+
+    def stats(self):
+        thinking = sum(session.request is not None for session in self.sessions.values())
+        return {"sessions": len(self.sessions), "thinking": thinking, "rollouts": self.rollouts}
+
+
+def game_state(board):
+    if not board.is_terminal():
+        return "PLAYING"
+    return {True: "X", False: "O", None: "DRAW"}[board.winner]
+
+
+class Protocol:
+    """The line-based front end of a GameService, one instance per client"""
+    def __init__(self, service):
+        self.service = service
+        self.sids = set()  # sessions opened by this client, closed with it
+
+    async def handle(self, line):
+        """The answer line to a request line"""
+        words = line.split()
+        if not words:
+            return None
+        command, args = words[0].upper(), words[1:]
+        try:
+            handler = getattr(self, "do_" + command.lower(), None)
+            if handler is None:
+                raise ValueError(f"unknown command {command}")
+            return await handler(*args)
+        except (ValueError, RuntimeError, TypeError, IndexError) as e:
+            return f"ERR {e}"
+
+    def _own(self, sid):
+        if sid not in self.sids:
+            raise ValueError(f"no session {sid}")
+        return sid
+
+    async def do_new(self, game="tictactoe", *args):
+        sid = self.service.new_session(game.lower(), *args)
+        self.sids.add(sid)
+        return f"OK {sid}"
+
+    async def do_move(self, sid, square, deadline_ms=None):
+        board = self.service.play(self._own(sid), int(square))
+        if board.is_terminal():
+            return f"OK {sid} {game_state(board)}"
+        return await self.do_go(sid, deadline_ms)
+
+    async def do_go(self, sid, deadline_ms=None):
+        deadline = None if deadline_ms is None else int(deadline_ms) / 1000
+        square, rollouts = await self.service.think(self._own(sid), deadline)
+        return f"MOVE {sid} {square} {game_state(self.service.sessions[sid].board)} {rollouts}"
+
+    async def do_show(self, sid):
+        board = self.service.sessions[self._own(sid)].board
+        return f"BOARD {sid} " + "|".join(board.to_pretty_string().strip("\n").splitlines())
+
+    async def do_close(self, sid):
+        self.service.close(self._own(sid))
+        self.sids.discard(sid)
+        return f"OK {sid}"
+
+    async def do_stats(self):
+        return "STATS " + " ".join(f"{k}={v}" for k, v in self.service.stats().items())
+
+    def close(self):
+        for sid in self.sids:
+            if sid in self.service.sessions:
+                self.service.close(sid)
+        self.sids.clear()
+
+
+async def _serve_lines(service, readline, write):
+    """
+    Answer the request lines of one client, each in its own task. Requests
+    on the same session are answered in the order they were sent.
+    """
+    protocol = Protocol(service)
+    tasks = set()
+    last = dict()  # latest task of each session named in a request
+
+    async def answer(line, previous):
+        if previous is not None:
+            await asyncio.wait([previous])
+        response = await protocol.handle(line)
+        if response is not None:
+            await write(response + "\n")
+
+    try:
+        while True:
+            line = await readline()
+            if not line:
+                break
+            words = line.split()
+            sid = words[1] if len(words) > 1 and words[0].upper() != "NEW" else None
+            task = asyncio.create_task(answer(line, last.get(sid)))
+            if sid is not None:
+                last[sid] = task
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)  # answer what was asked before the end of input
+    finally:
+        for task in tasks:
+            task.cancel()
+        protocol.close()
+
+
+async def serve_tcp(service, host="127.0.0.1", port=7777):
+    async def client(reader, writer):
+        async def readline():
+            return (await reader.readline()).decode()
+
+        async def write(text):
+            writer.write(text.encode())
+            await writer.drain()
+
+        try:
+            await _serve_lines(service, readline, write)
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(client, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+async def serve_stdio(service):
+    async def readline():
+        return await asyncio.to_thread(sys.stdin.readline)
+
+    async def write(text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    await _serve_lines(service, readline, write)
+
+
+async def _main(args):
+    async with GameService(slice_seconds=args.slice_ms / 1000, default_deadline=args.deadline_ms / 1000,
+                           max_sessions=args.max_sessions) as service:
+        if args.port is None:
+            await serve_stdio(service)
+        else:
+            await serve_tcp(service, args.host, args.port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve many MCTS games over a line-based protocol.")
+    parser.add_argument("--port", type=int, help="listen on this TCP port instead of stdin")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--slice-ms", type=float, default=5, help="length of a search time slice")
+    parser.add_argument("--deadline-ms", type=float, default=1000, help="default time to answer a move")
+    parser.add_argument("--max-sessions", type=int)
+    asyncio.run(_main(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Batch maze solving over a process pool.
+Reads a stream of maze specs, one JSON object per line such as
+    {"size": [40, 30], "seed": 7}
+    {"file": "maze.bin"}
+    {"corpus": "mazes.bin", "index": 12}
+(the last two in the formats of maze_file.py), solves every maze in a
+worker process with its own MazeMCTS and its own rollout or time budget
+per move, and writes one JSON line per maze as soon as it finishes, in
+completion order:
+    {"id": 0, "spec": {...}, "finished": true, "stuck": false, "path": [[x, y], ...],
+     "length": 57, "rollouts": 5700, "seconds": 0.84, "error": null}
+Only a bounded number of mazes are in flight at a time, and a maze that
+raises or runs out of its wall-time limit is reported with an `error`
+without holding up the others. So is a line that is not valid JSON, and
+the mazes in flight when a worker process dies, after which the pool is
+replaced and the stream goes on.
+"""
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+import json
+import os
+import random
+import sys
+import time
+import traceback
+
+from find_a_path import GuidedRollout, MazeMCTS, start_a_maze
+import maze_file
+
+
+class InvalidSpec(ValueError):
+    """A spec line that could not be parsed, passed on in place of its spec"""
+    def __init__(self, line, reason):
+        super().__init__(f"invalid spec: {reason}")
+        self.line = line
+
+
+def read_specs(stream):
+    """
+    Maze specs from the JSON lines of `stream`, skipping blank lines and #
+    comments. A line that is not valid JSON yields an InvalidSpec instead.
+    """
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield InvalidSpec(line, e)
+
+
+def _error(e):
+    return "".join(traceback.format_exception_only(type(e), e)).strip()
+
+
+def _result(spec, error=None):
+    """Result record of a maze that has not been walked, failed with `error` if given"""
+    return {"spec": spec, "finished": False, "stuck": False, "path": [], "length": 0, "rollouts": 0,
+            "seconds": 0.0, "error": error}
+
+
+@lru_cache(maxsize=8)
+def _open_corpus(path):
+    return maze_file.MazeCorpus(path)  # mapped once per worker process
+
+
+def load_maze(spec):
+    """The starting agent state for a maze spec"""
+    if "corpus" in spec:
+        record = _open_corpus(spec["corpus"])[spec["index"]]
+    elif "file" in spec:
+        record = maze_file.load_maze(spec["file"])
+    elif "size" in spec:
+        return start_a_maze(tuple(spec["size"]), seed=spec.get("seed"))
+    else:
+        raise ValueError(f"maze spec needs a size, file or corpus: {spec!r}")
+    return start_a_maze(record.size, codes=record.codes())
+
+
+def solve_maze(spec, rollouts_per_move=100, time_per_move=None, max_seconds=None, guided=False, seed=None):
+    """
+    Walk one maze, choosing every step after `rollouts_per_move` rollouts or
+    `time_per_move` seconds of search, whichever comes first. Gives up once
+    the walk has taken `max_seconds`. Returns the result record of the maze
+    and never raises.
+    """
+    start = time.perf_counter()
+    result = _result(spec)
+    try:
+        random.seed(seed)
+        state = load_maze(spec)
+        tree = MazeMCTS(simulator=GuidedRollout(seed=seed) if guided else None)
+        path = [state.current_position]
+        deadline = None if max_seconds is None else start + max_seconds
+        while not state.is_terminal():
+            move_deadline = None if time_per_move is None else time.perf_counter() + time_per_move
+            n = 0
+            while rollouts_per_move is None or n < rollouts_per_move:
+                tree.do_rollout(state)
+                n += 1
+                if move_deadline is not None and time.perf_counter() >= move_deadline:
+                    break
+            result["rollouts"] += n
+            state = tree.choose(state)
+            tree.reroot(state)  # keep only the subtree the walk can still reach
+            path.append(state.current_position)
+            if deadline is not None and time.perf_counter() >= deadline and not state.is_terminal():
+                raise TimeoutError(f"gave up after {max_seconds} seconds")
+        result["finished"] = state.finished
+        result["stuck"] = state.stuck
+    except Exception as e:
+        result["error"] = _error(e)
+    else:
+        result["path"] = [list(p) for p in path]
+        result["length"] = len(path) - 1
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def solve_mazes(specs, workers=None, max_in_flight=None, executor=None, seed=None, **solve_kwargs):
+    """
+    Solve the mazes of the iterable `specs` over `workers` processes and
+    yield their result records, each with the position of its spec as `id`,
+    in the order they finish. At most `max_in_flight` mazes (by default
+    twice the workers) are submitted ahead, so `specs` can be an endless
+    stream. An InvalidSpec in `specs` yields a failed record. When a worker
+    process dies, the mazes in flight on its pool are reported as failed
+    and the rest are solved on a new pool.
+    """
+    workers = workers or os.cpu_count()
+    max_in_flight = max_in_flight or 2 * workers
+    rng = random.Random(seed)
+    own_pool = executor is None
+    if own_pool:
+        executor = ProcessPoolExecutor(workers)
+    pending = {}
+    try:
+        for i, spec in enumerate(specs):
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield _record(pending.pop(future), future)
+            if isinstance(spec, InvalidSpec):
+                yield {"id": i, **_result(spec.line, _error(spec))}
+                continue
+            job_seed = rng.getrandbits(64)
+            try:
+                future = executor.submit(solve_maze, spec, seed=job_seed, **solve_kwargs)
+            except BrokenProcessPool:
+                # A worker died: the futures still pending fail with it (see
+                # _record), and this maze and the next go to a fresh pool
+                if own_pool:
+                    executor.shutdown(wait=False)
+                executor = ProcessPoolExecutor(workers)
+                own_pool = True
+                future = executor.submit(solve_maze, spec, seed=job_seed, **solve_kwargs)
+            pending[future] = (i, spec)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield _record(pending.pop(future), future)
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_pool:
+            executor.shutdown(cancel_futures=True)
+
+
+def _record(job, future):
+    """Result record of a finished future, also when its worker process died"""
+    i, spec = job
+    try:
+        result = future.result()
+    except Exception as e:
+        result = _result(spec, _error(e))
+    return {"id": i, **result}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve a stream of mazes over a process pool.")
+    parser.add_argument("specs", nargs="?", default="-", help="JSON lines of maze specs, - for stdin")
+    parser.add_argument("--output", "-o", default="-", help="where to write the JSON lines, - for stdout")
+    parser.add_argument("--workers", "-j", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--rollouts-per-move", type=int, default=100)
+    parser.add_argument("--time-per-move", type=float, help="seconds of search per move")
+    parser.add_argument("--max-seconds", type=float, help="wall-time limit of each maze")
+    parser.add_argument("--guided", action="store_true", help="guide the rollouts toward the exit")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    specs = sys.stdin if args.specs == "-" else open(args.specs)
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        results = solve_mazes(read_specs(specs), workers=args.workers, seed=args.seed,
+                              rollouts_per_move=args.rollouts_per_move, time_per_move=args.time_per_move,
+                              max_seconds=args.max_seconds, guided=args.guided)
+        for result in results:
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if specs is not sys.stdin:
+            specs.close()
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Compact on-disk mazes.
+A maze record is a 32-byte header
+    magic b"MAZEBIT1", cols, rows (uint32), entrance x, y, exit x, y (int32)
+followed by the wall grid, one bit per cell in row-major order (least
+significant bit first), padded to a whole byte. A 1000x1000 maze takes
+125 kB. Records are read through `np.memmap`, so opening a file copies
+nothing and the walls are only unpacked when a Maze is built from them.
+A corpus file holds many records behind an index:
+    magic b"MAZECRP1", count (uint64),
+    count index entries of offset (uint64), cols, rows (uint32), seed (int64),
+    the records.
+`generate_corpus` writes a corpus of seeded mazes, generated over a process
+pool. Run this file to generate one from the command line.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import os
+import struct
+
+import numpy as np
+
+from Maze_class import _CELL, _ENTRANCE, _EXIT, _WALL, generate_codes
+
+_HEADER = struct.Struct("<8sIIiiii")
+_MAGIC = b"MAZEBIT1"
+_CORPUS_HEADER = struct.Struct("<8sQ")
+_CORPUS_MAGIC = b"MAZECRP1"
+_INDEX = np.dtype([("offset", "<u8"), ("cols", "<u4"), ("rows", "<u4"), ("seed", "<i8")])
+
+
+def _location(codes, code):
+    """(x, y) of the first cell holding `code`, (-1, -1) if there is none"""
+    cells = np.flatnonzero(codes.ravel() == code)
+    if not len(cells):
+        return -1, -1
+    y, x = divmod(int(cells[0]), codes.shape[1])
+    return x, y
+
+
+def pack_codes(codes):
+    """The record of a maze given as its array of cell codes"""
+    rows, cols = codes.shape
+    walls = np.packbits(codes.ravel() == _WALL, bitorder="little")
+    header = _HEADER.pack(_MAGIC, cols, rows, *_location(codes, _ENTRANCE), *_location(codes, _EXIT))
+    return header + walls.tobytes()
+
+
+def pack_maze(maze):
+    """The record of a Maze"""
+    codes = np.where(maze.maze == maze.wall_value, _WALL, _CELL).astype(np.uint8)
+    codes[maze.entrance[1], maze.entrance[0]] = _ENTRANCE
+    codes[maze.exit[1], maze.exit[0]] = _EXIT
+    return pack_codes(codes)
+
+
+def save_maze(maze, path):
+    with open(path, "wb") as f:
+        f.write(pack_maze(maze))
+
+
+class MazeRecord:
+    """A maze record read in place from a buffer, usually a memmap"""
+    def __init__(self, buffer, offset=0):
+        header = bytes(buffer[offset:offset + _HEADER.size])
+        magic, self.cols, self.rows, ex, ey, xx, xy = _HEADER.unpack(header)
+        if magic != _MAGIC:
+            raise ValueError(f"not a maze record at offset {offset}")
+        self.entrance = (ex, ey)
+        self.exit = (xx, xy)
+        start = offset + _HEADER.size
+        self.packed = buffer[start:start + (self.rows * self.cols + 7) // 8]  # a view, not a copy
+
+    @property
+    def size(self):
+        return self.cols, self.rows
+
+    def is_wall(self, location):
+        x, y = location
+        p = y * self.cols + x
+        return bool(self.packed[p >> 3] >> (p & 7) & 1)
+
+    def walls(self):
+        """The (rows, cols) boolean array of the walls"""
+        bits = np.unpackbits(self.packed, count=self.rows * self.cols, bitorder="little")
+        return bits.reshape(self.rows, self.cols).view(bool)
+
+    def codes(self):
+        """The (rows, cols) array of cell codes, as taken by Maze(codes=...)"""
+        codes = np.where(self.walls(), _WALL, _CELL).astype(np.uint8)
+        if self.entrance[0] >= 0:
+            codes[self.entrance[1], self.entrance[0]] = _ENTRANCE
+        if self.exit[0] >= 0:
+            codes[self.exit[1], self.exit[0]] = _EXIT
+        return codes
+
+
+def load_maze(path):
+    """The maze record of a file written by save_maze"""
+    return MazeRecord(np.memmap(path, dtype=np.uint8, mode="r"))
+
+
+class MazeCorpus:
+    """Indexed, memory-mapped collection of maze records, as written by write_corpus"""
+    def __init__(self, path):
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, count = _CORPUS_HEADER.unpack(bytes(self.data[:_CORPUS_HEADER.size]))
+        if magic != _CORPUS_MAGIC:
+            raise ValueError(f"{path} is not a maze corpus")
+        self.index = np.frombuffer(self.data, dtype=_INDEX, count=count, offset=_CORPUS_HEADER.size)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        return MazeRecord(self.data, int(self.index[i]["offset"]))
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def seed(self, i):
+        return int(self.index[i]["seed"])
+
+
+def _generate_record(spec):
+    cols, rows, seed = spec
+    return pack_codes(generate_codes(cols, rows, seed))
+
+
+def write_corpus(path, specs, workers=1, chunksize=16):
+    """
+    Generate the mazes of `specs`, a sequence of (cols, rows, seed), and
+    write them to a corpus file in that order. With more than one worker the
+    mazes are generated over a process pool; records are written as they
+    arrive, so only a few of them are held in memory.
+    """
+    specs = list(specs)
+    index = np.zeros(len(specs), dtype=_INDEX)
+    with open(path, "wb") as f:
+        f.write(_CORPUS_HEADER.pack(_CORPUS_MAGIC, len(specs)))
+        f.write(index.tobytes())  # filled in once the offsets are known
+        if workers == 1:
+            records = map(_generate_record, specs)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(workers)
+            records = pool.map(_generate_record, specs, chunksize=chunksize)
+        try:
+            for i, ((cols, rows, seed), record) in enumerate(zip(specs, records)):
+                index[i] = (f.tell(), cols, rows, seed)
+                f.write(record)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        f.seek(_CORPUS_HEADER.size)
+        f.write(index.tobytes())
+
+
+def generate_corpus(path, count, size, first_seed=0, workers=None):
+    """Write a corpus of `count` mazes of `size` (cols, rows) with seeds first_seed, first_seed + 1, ..."""
+    cols, rows = size
+    specs = [(cols, rows, first_seed + i) for i in range(count)]
+    write_corpus(path, specs, workers=workers or os.cpu_count())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a corpus of seeded mazes.")
+    parser.add_argument("path")
+    parser.add_argument("--count", "-n", type=int, default=1000)
+    parser.add_argument("--size", type=int, nargs=2, default=(40, 40), metavar=("COLS", "ROWS"))
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first maze")
+    parser.add_argument("--workers", "-j", type=int, help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+    generate_corpus(args.path, args.count, args.size, args.seed, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+The m,n,k-game: two players take turns placing stones on an m-by-n board,
+and the first to get k in a row, horizontally, vertically or diagonally,
+wins. Tic-tac-toe is the 3,3,3-game and Gomoku the 15,15,5-game.
+If you run this file then you can play Gomoku against the computer.
+Each player's stones are packed into one integer with a bit per square.
+The rows are laid out `stride = n + 1` bits apart, so that every row ends
+in an always-empty guard bit: walking along a line from a square then
+stops at the edge of the board without any column checks. A move only has
+to look at the four lines through the new stone to find out if it won.
+Squares are indexed by row, `index = row * n + col`, as in tic_tac_toe.py.
+"""
+from random import randrange, shuffle
+from monte_carlo_tree_search import ArrayMCTS, Node
+
+
+class MNKRules:
+    """Board size and row length shared by all the boards of a game"""
+    def __init__(self, m, n, k):
+        if k > max(m, n):
+            raise ValueError(f"no line of {k} fits on a {m}x{n} board")
+        self.m = m  # rows
+        self.n = n  # columns
+        self.k = k
+        self.stride = n + 1
+        self.squares = m * n
+        row = (1 << n) - 1
+        self.full = sum(row << r * self.stride for r in range(m))  # every square, no guard bits
+        # Steps between neighbouring squares along a row, a column and the two diagonals
+        self.directions = (1, self.stride, self.stride + 1, self.stride - 1)
+
+    def bit(self, index):
+        """Bit of the square `index`"""
+        return index + index // self.n
+
+    def index(self, bit):
+        """Square of the bit `bit`"""
+        row, col = divmod(bit, self.stride)
+        return row * self.n + col
+
+
+class MNKBoard(Node):
+    """
+    An immutable m,n,k-game position: the stones of X (`x`) and O (`o`),
+    and the winner as found when the last stone was placed.
+    """
+    __slots__ = ("rules", "x", "o", "turn", "winner", "stones")
+
+    def __init__(self, rules, x=0, o=0, turn=True, winner=None, stones=0):
+        self.rules = rules
+        self.x = x
+        self.o = o
+        self.turn = turn  # True if it is X's turn, False if it is O's
+        self.winner = winner  # None if no winner, True if X won, False if O won
+        self.stones = stones
+
+    @property
+    def terminal(self):
+        return self.winner is not None or self.stones == self.rules.squares
+
+    def find_children(self):
+        if self.terminal:  # If the game is finished then no moves can be made
+            return set()
+        # Otherwise, you can make a move in each of the empty spots
+        children = set()
+        empty = self.rules.full & ~(self.x | self.o)
+        while empty:
+            low = empty & -empty
+            children.add(self._place(low.bit_length() - 1))
+            empty ^= low
+        return children
+
+    def find_random_child(self):
+        if self.terminal:
+            return None  # If the game is finished then no moves can be made
+        rules = self.rules
+        taken = self.x | self.o
+        if 4 * self.stones < 3 * rules.squares:
+            # At least a quarter of the board is empty: draw squares until one is free
+            while True:
+                bit = rules.bit(randrange(rules.squares))
+                if not taken >> bit & 1:
+                    return self._place(bit)
+        empty = rules.full & ~taken
+        k = randrange(rules.squares - self.stones)
+        for _ in range(k):
+            empty &= empty - 1  # drop the lowest empty square
+        return self._place((empty & -empty).bit_length() - 1)
+
+    def iter_children(self):
+        if self.terminal:
+            return
+        empty = self.rules.full & ~(self.x | self.o)
+        bits = []
+        while empty:
+            low = empty & -empty
+            bits.append(low.bit_length() - 1)
+            empty ^= low
+        shuffle(bits)  # try the moves in random order, building each board only when asked
+        for bit in bits:
+            yield self._place(bit)
+
+    def reward(self):
+        if not self.terminal:
+            raise RuntimeError(f"reward called on nonterminal board {self}")
+        if self.winner is self.turn:
+            # It's your turn and you've already won. Should be impossible.
+            raise RuntimeError(f"reward called on unreachable board {self}")
+        if self.winner is not None:
+            return 0  # Your opponent has just won. Bad.
+        return 0.5  # Board is a tie
+
+    def is_terminal(self):
+        return self.terminal
+
+    def move_to(self, child):
+        """The square played to reach `child`"""
+        return self.rules.index(((child.x | child.o) ^ (self.x | self.o)).bit_length() - 1)
+
+    def make_move(self, index):
+        bit = self.rules.bit(index)
+        if (self.x | self.o) >> bit & 1:
+            raise ValueError(f"square {index} is taken")
+        return self._place(bit)
+
+    def _place(self, bit):
+        """The board after the player to move puts a stone on the empty `bit`"""
+        x, o = self.x, self.o
+        if self.turn:
+            x |= 1 << bit
+            stones = x
+        else:
+            o |= 1 << bit
+            stones = o
+        winner = self.turn if self._completes_line(stones, bit) else None
+        return MNKBoard(self.rules, x, o, not self.turn, winner, self.stones + 1)
+
+    def _completes_line(self, stones, bit):
+        """True if `stones` hold k in a row through `bit`, only walking the four lines through it"""
+        k = self.rules.k
+        for step in self.rules.directions:
+            count = 1
+            j = bit + step
+            while stones >> j & 1:
+                count += 1
+                j += step
+            j = bit - step
+            while j >= 0 and stones >> j & 1:
+                count += 1
+                j -= step
+            if count >= k:
+                return True
+        return False
+
+    def to_pretty_string(self):
+        rules = self.rules
+        rows = []
+        for r in range(rules.m):
+            row = []
+            for c in range(rules.n):
+                bit = r * rules.stride + c
+                row.append("X" if self.x >> bit & 1 else ("O" if self.o >> bit & 1 else "."))
+            rows.append(f"{r + 1:>2} " + " ".join(row))
+        header = "   " + " ".join(chr(ord("a") + c) for c in range(rules.n))
+        return "\n" + header + "\n" + "\n".join(rows) + "\n"
+
+    def __hash__(self):
+        return hash((self.x, self.o))
+
+    def __eq__(self, other):
+        return self.x == other.x and self.o == other.o and self.rules is other.rules
+
+    def __repr__(self):
+        rules = self.rules
+        return f"MNKBoard({rules.m}, {rules.n}, {rules.k}, stones={self.stones}, winner={self.winner})"
+
+
+def new_mnk_board(m=15, n=15, k=5):
+    return MNKBoard(MNKRules(m, n, k))
+
+
+def play_game(m=15, n=15, k=5, rollouts=2000):
+    tree = ArrayMCTS()
+    board = new_mnk_board(m, n, k)
+    print(board.to_pretty_string())
+    while True:
+        move = input("enter a square, e.g. h8: ")
+        col, row = ord(move[0]) - ord("a"), int(move[1:]) - 1
+        board = board.make_move(row * n + col)
+        print(board.to_pretty_string())
+        if board.terminal:
+            break
+        tree.reroot(board)  # forget the branches the game can no longer reach
+        for _ in range(rollouts):
+            tree.do_rollout(board)
+        board = tree.choose(board)
+        print(board.to_pretty_string())
+        if board.terminal:
+            break
+
+
+if __name__ == "__main__":
+    play_game()
@@ -2,40 +2,221 @@
 https://gist.github.com/qpwo/c538c6f73727e254fdc7fab81024f6e1
 """
 from abc import ABC, abstractmethod
+from array import array
 from collections import defaultdict
 import math
+import time
+from events import NULL_SINK, ChoiceMade, Expand, RolloutFinished
+from profiling import RolloutProfiler
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, ArrayMCTS falls back to scalar UCT
+    np = None
 
 
 class MCTS:
-    """Monte Carlo tree searcher. First rollout the tree then choose a move."""
-    def __init__(self, exploration_weight=1):
+    """
+    Monte Carlo tree searcher. First rollout the tree then choose a move.
+    With `canonicalize=True` the tree is keyed by `node.canonical()`, so all
+    symmetric variants of a state share one entry.
+    With a `max_nodes` budget, the least-visited leaves are evicted whenever
+    more than `max_nodes` nodes have been expanded.
+    A `simulator(node)` replaces the random playout of `_simulate`; it must
+    return the reward of the player who moved into `node`.
+    Expansions, finished rollouts and choices are reported to `observer`
+    (see events.py), which by default ignores them.
+    With `profile=True` the phases and game callbacks of every rollout are
+    timed (see profiling.py); read the results with `profile_stats`.
+    A `book` (see opening_book.py) answers `choose` and `search` without
+    searching whenever `book.choose(node)` covers the position.
+    """
+    # Eviction frees nodes down to this fraction of `max_nodes`, so that it
+    # runs once per batch of expansions rather than on every rollout.
+    eviction_target = 0.9
+    # `search` checks for an early stop once every this many rollouts
+    search_check_interval = 16
+    # Two-player games alternate the point of view at every ply
+    invert_rewards = True
+
+    def __init__(self, exploration_weight=1, canonicalize=False, max_nodes=None, simulator=None,
+                 observer=NULL_SINK, profile=False, book=None):
         self.Q = defaultdict(int)  # total reward of each node
         self.N = defaultdict(int)  # total visit count for each node
         self.children = dict()  # children of each node
         self.exploration_weight = exploration_weight
+        self.canonicalize = canonicalize
+        self.max_nodes = max_nodes
+        self.simulator = simulator
+        self.observer = observer
+        self.root = None  # node of the latest rollout, never evicted
+        self.book = book
+        self.profiler = None
+        if profile:
+            self.profiler = RolloutProfiler()
+            self.profiler.instrument(self)
 
     def choose(self, node):
         """Choose the best successor of node. (Choose a move in the game)"""
         if node.is_terminal():
             raise RuntimeError(f"choose called on terminal node {node}")
+        if self.book is not None:
+            choice = self._book_choice(node)
+            if choice is not None:
+                return choice
 
-        if node not in self.children:
+        key = node.canonical() if self.canonicalize else node
+        if key not in self.children:
             return node.find_random_child()
 
-        def score(n):
-            if self.N[n] == 0:
-                return float("-inf")  # avoid unseen moves
-            return self.Q[n] / self.N[n]  # average reward
+        choice = self._orient(node, max(self.children[key], key=self._choice_score))
+        if self.observer.enabled:
+            self.observer.emit(ChoiceMade(node, choice))
+        return choice
+
+    def _book_choice(self, node):
+        """The book move from `node`, None if the book does not cover it"""
+        choice = self.book.choose(node)
+        if choice is not None and self.observer.enabled:
+            self.observer.emit(ChoiceMade(node, choice))
+        return choice
+
+    def _choice_score(self, n):
+        if self.N[n] == 0:
+            return float("-inf")  # avoid unseen moves
+        return self.Q[n] / self.N[n]  # average reward
+
+    def search(self, root, time_budget=None, max_rollouts=None, min_rollouts=0):
+        """
+        Roll out from `root` until `time_budget` seconds have passed or
+        `max_rollouts` rollouts are done, then choose a move.
+        After `min_rollouts`, stops as soon as the most visited child of
+        `root` can no longer be overtaken in visits within the rollouts left
+        in the budget, and then plays that child.
+        """
+        if time_budget is None and max_rollouts is None:
+            raise ValueError("search needs a time_budget or max_rollouts")
+        if self.book is not None:
+            choice = self._book_choice(root)
+            if choice is not None:
+                return choice
+        start = time.perf_counter()
+        deadline = None if time_budget is None else start + time_budget
+        rollouts = 0
+        while max_rollouts is None or rollouts < max_rollouts:
+            self.do_rollout(root)
+            rollouts += 1
+            now = time.perf_counter()
+            if deadline is not None and now >= deadline:
+                break
+            if rollouts < min_rollouts or rollouts % self.search_check_interval:
+                continue
+            remaining = float("inf")
+            if max_rollouts is not None:
+                remaining = max_rollouts - rollouts
+            if deadline is not None:  # at the rate observed so far
+                remaining = min(remaining, (deadline - now) * rollouts / (now - start))
+            choice = self._decided(root, remaining)
+            if choice is not None:
+                if self.observer.enabled:
+                    self.observer.emit(ChoiceMade(root, choice))
+                return choice
+        return self.choose(root)
+
+    def _decided(self, root, remaining):
+        """
+        The move to play from `root` once the search can stop, else None:
+        the most visited child, once it leads every other child by more
+        visits than `remaining`, so that no other child can catch up with it
+        within the budget.
+        """
+        stats = self._child_stats(root)
+        if not stats:
+            return None
+        best = max(stats, key=lambda s: s[2])
+        runner_up = max((n for child, _, n in stats if child is not best[0]), default=-1)
+        if best[2] - runner_up <= remaining:
+            return None
+        return self._orient(root, best[0])
+
+    def profile_stats(self):
+        """Profile of the rollouts so far as a dict, None unless built with profile=True"""
+        if self.profiler is None:
+            return None
+        return self.profiler.as_dict(tree_size=self._tree_size())
 
-        return max(self.children[node], key=score)
+    def profile_prometheus(self, prefix="mcts"):
+        """Profile of the rollouts so far in the Prometheus text format"""
+        if self.profiler is None:
+            return ""
+        return self.profiler.to_prometheus(tree_size=self._tree_size(), prefix=prefix)
+
+    def _tree_size(self):
+        """Number of expanded nodes, the same count in every tree class"""
+        return len(self.children)
+
+    def _orient(self, node, child):
+        """The actual child of `node` that the tree child `child` stands for"""
+        if not self.canonicalize:
+            return child
+        return next(n for n in node.find_children() if n.canonical() == child)
+
+    def _child_stats(self, node):
+        """(child, Q, N) for each tree child of `node`, empty if it is unexpanded"""
+        key = node.canonical() if self.canonicalize else node
+        return [(n, self.Q.get(n, 0), self.N.get(n, 0)) for n in self.children.get(key, ())]
 
     def do_rollout(self, node):
         """Make the tree one layer better. (Train for one iteration.)"""
+        if self.canonicalize:
+            node = node.canonical()
+        self.root = node
         path = self._select(node)
         leaf = path[-1]
         self._expand(leaf)
         reward = self._simulate(leaf)
         self._backpropagate(path, reward)
+        if self.observer.enabled:
+            self.observer.emit(RolloutFinished(len(path), reward))
+        if self.max_nodes is not None and len(self.children) > self.max_nodes:
+            self._evict()
+
+    def reroot(self, node):
+        """
+        Make `node`, the position actually reached, the root of the tree and
+        forget every node that can no longer be reached from it.
+        """
+        if self.canonicalize:
+            node = node.canonical()
+        self.root = node
+        reachable = set()
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n not in reachable:
+                reachable.add(n)
+                stack.extend(self.children.get(n, ()))
+        self.children = {n: c for n, c in self.children.items() if n in reachable}
+        self.Q = defaultdict(int, {n: q for n, q in self.Q.items() if n in reachable})
+        self.N = defaultdict(int, {n: v for n, v in self.N.items() if n in reachable})
+
+    def _evict(self):
+        """Drop the least-visited expanded leaves until the tree is back under budget"""
+        target = int(self.max_nodes * self.eviction_target)
+        while len(self.children) > target:
+            leaves = [
+                n for n, children in self.children.items()
+                if n != self.root and not any(c in self.children for c in children)
+            ]
+            if not leaves:
+                return
+            leaves.sort(key=lambda n: self.N[n])
+            for n in leaves[:len(self.children) - target]:
+                # `n` keeps its own statistics and simply becomes unexplored again
+                for c in self.children.pop(n):
+                    if c not in self.children:
+                        self.Q.pop(c, None)
+                        self.N.pop(c, None)
 
     def _select(self, node):
         """Find an unexplored descendent of `node`"""
@@ -56,24 +237,40 @@ class MCTS:
         """Update the `children` dict with the children of `node`"""
         if node in self.children:
             return  # already expanded
-        self.children[node] = node.find_children()
+        if self.profiler is None:
+            children = node.find_children()
+        else:
+            children = self.profiler.call("find_children", node.find_children)
+        if self.canonicalize:
+            children = {n.canonical() for n in children}
+        self.children[node] = children
+        if self.observer.enabled:
+            self.observer.emit(Expand(node, len(children)))
 
     def _simulate(self, node):
         """Returns the reward for a random simulation (to completion) of `node`"""
-        invert_reward = True
+        if self.simulator is not None:
+            return self.simulator(node)
+        invert = self.invert_rewards
+        invert_reward = invert
+        profiler = self.profiler
         while True:
             if node.is_terminal():
                 reward = node.reward()
                 return 1 - reward if invert_reward else reward
-            node = node.find_random_child()
-            invert_reward = not invert_reward
+            if profiler is None:
+                node = node.find_random_child()
+            else:
+                node = profiler.call("find_random_child", node.find_random_child)
+            invert_reward ^= invert
 
     def _backpropagate(self, path, reward):
         """Send the reward back up to the ancestors of the leaf"""
         for node in reversed(path):
             self.N[node] += 1
             self.Q[node] += reward
-            reward = 1 - reward  # 1 for me is 0 for my enemy, and vice versa
+            if self.invert_rewards:
+                reward = 1 - reward  # 1 for me is 0 for my enemy, and vice versa
 
     def _uct_select(self, node):
         """Select a child of node, balancing exploration & exploitation"""
@@ -92,12 +289,536 @@ class MCTS:
         return max(self.children[node], key=uct)
 
 
+class ArrayMCTS(MCTS):
+    """
+    MCTS with array-backed tree storage. Same API as `MCTS`.
+    Every node is interned once to an integer id. Statistics live in
+    contiguous columns indexed by id, and the children of a node occupy a
+    contiguous range of the `edges` column (CSR layout), so the hot loops
+    never hash a node after it has been interned.
+    When NumPy is available, UCT scores all the children of a node in one
+    vectorized operation over those columns.
+    """
+    # Below this many children the scalar loop beats the NumPy call overhead
+    vectorize_min_children = 16
+
+    def __init__(self, exploration_weight=1, vectorized=None, canonicalize=False, simulator=None,
+                 observer=NULL_SINK, profile=False, book=None):
+        if vectorized is None:
+            vectorized = np is not None
+        elif vectorized and np is None:
+            raise ImportError("vectorized UCT selection requires NumPy")
+        self.ids = dict()  # id of each interned node
+        self.nodes = []  # node of each id
+        self.Q = array("d")  # total reward of each node id
+        self.N = array("q")  # total visit count for each node id
+        self.log_N = array("d")  # cached log(N) of each node id, for UCT
+        self.first_child = array("q")  # offset of the children in `edges`, -1 if unexpanded
+        self.n_children = array("q")  # number of children of each node id
+        self.cursor = array("q")  # offset in `edges` of the next possibly unexplored child
+        self.edges = array("q")  # child ids, grouped by parent
+        self.exploration_weight = exploration_weight
+        self.vectorized = vectorized
+        self.canonicalize = canonicalize
+        self.simulator = simulator
+        self.observer = observer
+        self.book = book
+        self.profiler = None
+        if profile:
+            self.profiler = RolloutProfiler()
+            self.profiler.instrument(self)
+
+    def _intern(self, node):
+        """Return the id of `node`, allocating a new row if it is unseen"""
+        node_id = self.ids.get(node)
+        if node_id is None:
+            node_id = self.ids[node] = len(self.nodes)
+            self.nodes.append(node)
+            self.Q.append(0.0)
+            self.N.append(0)
+            self.log_N.append(0.0)
+            self.first_child.append(-1)
+            self.n_children.append(0)
+            self.cursor.append(0)
+        return node_id
+
+    def _child_ids(self, node_id):
+        start = self.first_child[node_id]
+        return self.edges[start:start + self.n_children[node_id]]
+
+    def choose(self, node):
+        """Choose the best successor of node. (Choose a move in the game)"""
+        if node.is_terminal():
+            raise RuntimeError(f"choose called on terminal node {node}")
+
+        if self.book is not None:
+            choice = self._book_choice(node)
+            if choice is not None:
+                return choice
+
+        node_id = self.ids.get(node.canonical() if self.canonicalize else node)
+        if node_id is None or self.first_child[node_id] < 0:
+            return node.find_random_child()
+
+        Q, N = self.Q, self.N
+
+        def score(c):
+            if N[c] == 0:
+                return float("-inf")  # avoid unseen moves
+            return Q[c] / N[c]  # average reward
+
+        choice = self._orient(node, self.nodes[max(self._child_ids(node_id), key=score)])
+        if self.observer.enabled:
+            self.observer.emit(ChoiceMade(node, choice))
+        return choice
+
+    def _child_stats(self, node):
+        node_id = self.ids.get(node.canonical() if self.canonicalize else node)
+        if node_id is None or self.first_child[node_id] < 0:
+            return []
+        return [(self.nodes[c], self.Q[c], self.N[c]) for c in self._child_ids(node_id)]
+
+    def _tree_size(self):
+        return sum(1 for offset in self.first_child if offset >= 0)  # expanded, not merely interned
+
+    def do_rollout(self, node):
+        """Make the tree one layer better. (Train for one iteration.)"""
+        path = self._select(self._intern(node.canonical() if self.canonicalize else node))
+        leaf = path[-1]
+        self._expand(leaf)
+        reward = self._simulate(self.nodes[leaf])
+        self._backpropagate(path, reward)
+        if self.observer.enabled:
+            self.observer.emit(RolloutFinished(len(path), reward))
+
+    def reroot(self, node):
+        """
+        Make `node` the root of the tree and compact the columns down to the
+        nodes that can still be reached from it.
+        """
+        if self.canonicalize:
+            node = node.canonical()
+        root = self.ids.get(node)
+        order = [] if root is None else [root]  # old ids, in new id order
+        new_id = {} if root is None else {root: 0}
+        for old in order:  # grows while iterating: breadth-first traversal
+            if self.first_child[old] >= 0:
+                for c in self._child_ids(old):
+                    if c not in new_id:
+                        new_id[c] = len(order)
+                        order.append(c)
+        edges = array("q")
+        first_child, cursor = array("q"), array("q")
+        for old in order:
+            start = self.first_child[old]
+            if start < 0:
+                first_child.append(-1)
+                cursor.append(0)
+            else:
+                first_child.append(len(edges))
+                cursor.append(len(edges) + self.cursor[old] - start)
+                edges.extend(new_id[c] for c in self._child_ids(old))
+        self.nodes = [self.nodes[old] for old in order]
+        self.ids = {n: i for i, n in enumerate(self.nodes)}
+        for column in ("Q", "N", "log_N", "n_children"):
+            old_column = getattr(self, column)
+            setattr(self, column, array(old_column.typecode, (old_column[old] for old in order)))
+        self.first_child, self.cursor, self.edges = first_child, cursor, edges
+
+    def _select(self, node_id):
+        """Find an unexplored descendent of `node_id`, as a path of ids"""
+        path = []
+        while True:
+            path.append(node_id)
+            if self.first_child[node_id] < 0 or not self.n_children[node_id]:
+                # node is either unexplored or terminal
+                return path
+            # Children are explored in edge order, so a per-node cursor
+            # skips the ones already expanded (possibly via a transposition).
+            k = self.cursor[node_id]
+            end = self.first_child[node_id] + self.n_children[node_id]
+            while k < end and self.first_child[self.edges[k]] >= 0:
+                k += 1
+            self.cursor[node_id] = k
+            if k < end:
+                path.append(self.edges[k])
+                return path
+            node_id = self._uct_select(node_id)  # descend a layer deeper
+
+    def _expand(self, node_id):
+        """Append the children of `node_id` to the edge list"""
+        if self.first_child[node_id] >= 0:
+            return  # already expanded
+        node = self.nodes[node_id]
+        if self.profiler is None:
+            children = node.find_children()
+        else:
+            children = self.profiler.call("find_children", node.find_children)
+        if self.canonicalize:
+            children = {n.canonical() for n in children}
+        children = [self._intern(n) for n in children]
+        self.first_child[node_id] = self.cursor[node_id] = len(self.edges)
+        self.n_children[node_id] = len(children)
+        self.edges.extend(children)
+        if self.observer.enabled:
+            self.observer.emit(Expand(node, len(children)))
+
+    def _backpropagate(self, path, reward):
+        """Send the reward back up to the ancestors of the leaf"""
+        Q, N, log_N = self.Q, self.N, self.log_N
+        for node_id in reversed(path):
+            N[node_id] += 1
+            Q[node_id] += reward
+            log_N[node_id] = math.log(N[node_id])
+            if self.invert_rewards:
+                reward = 1 - reward  # 1 for me is 0 for my enemy, and vice versa
+
+    def _uct_select(self, node_id):
+        """Select a child of node_id, balancing exploration & exploitation"""
+        if self.vectorized and self.n_children[node_id] >= self.vectorize_min_children:
+            return self._uct_select_vectorized(node_id)
+
+        Q, N = self.Q, self.N
+        log_N_vertex = self.log_N[node_id]
+
+        def uct(c):
+            """Upper confidence bound for trees"""
+            return Q[c] / N[c] + self.exploration_weight * math.sqrt(
+                log_N_vertex / N[c]
+            )
+
+        return max(self._child_ids(node_id), key=uct)
+
+    def _uct_select_vectorized(self, node_id):
+        """`_uct_select` scoring every child in one NumPy operation"""
+        # The views are dropped on return, so the columns can still grow.
+        child_ids = np.frombuffer(
+            self.edges, dtype=np.int64, count=self.n_children[node_id],
+            offset=self.first_child[node_id] * self.edges.itemsize,
+        )
+        q = np.frombuffer(self.Q, dtype=np.float64)[child_ids]
+        n = np.frombuffer(self.N, dtype=np.int64)[child_ids]
+        uct = q / n + self.exploration_weight * np.sqrt(self.log_N[node_id] / n)
+        return int(child_ids[uct.argmax()])
+
+
+class SolverMCTS(MCTS):
+    """
+    MCTS-Solver: MCTS that also proves game values.
+    A terminal node is proven with its exact reward, and a node is proven as
+    soon as its value follows from its children by minimax: in a two-player
+    game, when one child is a proven win for the player to move, or else
+    when all the children are proven. `proven[node]` holds the value of a
+    proven node for the player who moved into it, like Q / N.
+    Selection never descends into a proven node, a rollout reaching one
+    backs up its exact value without a playout, `choose` plays a proven win
+    at once and `search` stops as soon as the root's move is proven.
+    """
+    def __init__(self, exploration_weight=1, **kwargs):
+        super().__init__(exploration_weight, **kwargs)
+        self.proven = dict()  # exact value of each proven node
+
+    def reroot(self, node):
+        super().reroot(node)
+        self.proven = {n: v for n, v in self.proven.items() if n in self.N}
+
+    def _evict(self):
+        super()._evict()
+        self.proven = {n: v for n, v in self.proven.items() if n in self.N}
+
+    def _choice_score(self, n):
+        value = self.proven.get(n)
+        if value is None:
+            return super()._choice_score(n)
+        return float("inf") if value == 1 else value
+
+    def _decided(self, root, remaining):
+        key = root.canonical() if self.canonicalize else root
+        if key in self.proven or any(self.proven.get(c) == 1 for c in self.children.get(key, ())):
+            return self._orient(root, max(self.children[key], key=self._choice_score))  # by proven value
+        return super()._decided(root, remaining)
+
+    def _select(self, node):
+        """Find an unexplored or proven descendent of `node`"""
+        path = []
+        while True:
+            path.append(node)
+            if node in self.proven or node not in self.children or not self.children[node]:
+                # node is either proven, unexplored or terminal
+                return path
+            unexplored = self.children[node] - self.children.keys()
+            if unexplored:
+                n = unexplored.pop()
+                path.append(n)
+                return path
+            node = self._uct_select(node)  # descend a layer deeper
+
+    def _uct_select(self, node):
+        """UCT over the children that are not proven yet"""
+        log_N_vertex = math.log(self.N[node])
+        proven = self.proven
+
+        def uct(n):
+            if n in proven:
+                return float("-inf")
+            return self.Q[n] / self.N[n] + self.exploration_weight * math.sqrt(log_N_vertex / self.N[n])
+
+        return max(self.children[node], key=uct)
+
+    def _simulate(self, node):
+        value = self.proven.get(node)
+        if value is not None:
+            return value
+        if node.is_terminal():
+            reward = node.reward()
+            value = self.proven[node] = 1 - reward if self.invert_rewards else reward
+            return value
+        return super()._simulate(node)
+
+    def _backpropagate(self, path, reward):
+        super()._backpropagate(path, reward)
+        # Carry the proof of the leaf up the path for as long as it settles the parents
+        for node in reversed(path[:-1]):
+            if node in self.proven or not self._prove(node):
+                return
+
+    def _prove(self, node):
+        """Prove `node` from its children if they settle its value, returning whether they did"""
+        best = None
+        unproven = False
+        for child in self.children.get(node, ()):
+            value = self.proven.get(child)
+            if value is None:
+                unproven = True
+            elif value == 1:
+                best = 1  # the player to move has a proven win, the other children do not matter
+                break
+            elif best is None or value > best:
+                best = value
+        else:
+            if unproven or best is None:
+                return False
+        self.proven[node] = 1 - best if self.invert_rewards else best
+        return True
+
+
+class RaveMCTS(MCTS):
+    """
+    MCTS with RAVE (rapid action value estimation) statistics.
+    Besides Q and N of every node, the tree keeps all-moves-as-first (AMAF)
+    statistics for every (node, move) pair: after each rollout, every move
+    that the player to move at a node played later in the rollout, in the
+    tree or in the playout, counts as if it had been played first from that
+    node. UCT scores a child by its mean reward blended with the AMAF mean
+    of its move. The weight of AMAF is the minimum-error schedule of Gelly &
+    Silver, beta = n / (N + n + 4 * rave_bias ** 2 * N * n) for n AMAF
+    visits, which fades as the child itself is visited. Unexplored children
+    are tried in order of their AMAF means.
+    Nodes must name their moves with `Node.move_to`. Symmetric trees
+    (canonicalize=True) are not supported, since the moves of canonical
+    states do not line up with the moves actually played.
+    """
+    def __init__(self, exploration_weight=1, rave_bias=0.1, **kwargs):
+        if kwargs.get("canonicalize"):
+            raise ValueError("RaveMCTS does not support canonicalize=True")
+        super().__init__(exploration_weight, **kwargs)
+        self.rave_bias = rave_bias
+        self.moves = dict()  # move leading to each child of each expanded node
+        self.amaf_Q = defaultdict(float)  # total AMAF reward of each (node, move)
+        self.amaf_N = defaultdict(int)  # AMAF visit count of each (node, move)
+        self._playout_moves = []  # moves of the latest playout
+
+    def reroot(self, node):
+        super().reroot(node)
+        self._forget()
+
+    def _evict(self):
+        super()._evict()
+        self._forget()
+
+    def _forget(self):
+        """Drop the moves and AMAF statistics of the nodes no longer expanded"""
+        self.moves = {n: m for n, m in self.moves.items() if n in self.children}
+        self.amaf_Q = defaultdict(float, {k: q for k, q in self.amaf_Q.items() if k[0] in self.children})
+        self.amaf_N = defaultdict(int, {k: n for k, n in self.amaf_N.items() if k[0] in self.children})
+
+    def _expand(self, node):
+        if node in self.children:
+            return  # already expanded
+        super()._expand(node)
+        self.moves[node] = {child: node.move_to(child) for child in self.children[node]}
+
+    def _simulate(self, node):
+        """Random playout of `node` as in MCTS, recording its moves"""
+        moves = self._playout_moves = []
+        if self.simulator is not None:
+            return self.simulator(node)  # the moves of the simulator are unknown
+        invert = self.invert_rewards
+        invert_reward = invert
+        profiler = self.profiler
+        while True:
+            if node.is_terminal():
+                reward = node.reward()
+                return 1 - reward if invert_reward else reward
+            if profiler is None:
+                child = node.find_random_child()
+            else:
+                child = profiler.call("find_random_child", node.find_random_child)
+            moves.append(node.move_to(child))
+            node = child
+            invert_reward ^= invert
+
+    def _backpropagate(self, path, reward):
+        super()._backpropagate(path, reward)
+        moves = [self.moves[a][b] for a, b in zip(path, path[1:])] + self._playout_moves
+        # Walking back from the last move, first[p] holds the first move of
+        # each kind that player p plays at or after ply i
+        players = 2 if self.invert_rewards else 1
+        first = [set() for _ in range(players)]
+        for i in range(len(moves) - 1, -1, -1):
+            if moves[i] is not None:
+                first[i % players].add(moves[i])
+            if i >= len(path) - 1:
+                continue  # a ply of the playout, not from a tree node
+            # Reward of the player to move at path[i], who moved into path[i + 1]
+            flip = self.invert_rewards and (len(path) - 2 - i) % 2
+            value = 1 - reward if flip else reward
+            node = path[i]
+            for move in first[i % players]:
+                self.amaf_N[node, move] += 1
+                self.amaf_Q[node, move] += value
+
+    def _select(self, node):
+        """Find an unexplored descendent of `node`, trying unexplored children by their AMAF means"""
+        path = []
+        while True:
+            path.append(node)
+            if node not in self.children or not self.children[node]:
+                # node is either unexplored or terminal
+                return path
+            unexplored = self.children[node] - self.children.keys()
+            if unexplored:
+                path.append(max(unexplored, key=lambda n: self._amaf_mean(node, n)))
+                return path
+            node = self._uct_select(node)  # descend a layer deeper
+
+    def _amaf_mean(self, node, child):
+        """AMAF mean of the move from `node` to `child`, 1 (optimistic) before it has been played"""
+        key = (node, self.moves[node][child])
+        visits = self.amaf_N.get(key)
+        return self.amaf_Q[key] / visits if visits else 1
+
+    def _uct_select(self, node):
+        """UCT on the means blended with the AMAF means of the moves"""
+        log_N_vertex = math.log(self.N[node])
+        moves = self.moves[node]
+        k = 4 * self.rave_bias ** 2
+
+        def uct(n):
+            q, visits = self.Q[n] / self.N[n], self.N[n]
+            key = (node, moves[n])
+            amaf_visits = self.amaf_N.get(key)
+            if amaf_visits:
+                beta = amaf_visits / (visits + amaf_visits + k * visits * amaf_visits)
+                q = (1 - beta) * q + beta * self.amaf_Q[key] / amaf_visits
+            return q + self.exploration_weight * math.sqrt(log_N_vertex / visits)
+
+        return max(self.children[node], key=uct)
+
+
+class ProgressiveWideningMCTS(MCTS):
+    """
+    MCTS with lazy expansion and progressive widening.
+    Expanding a node only keeps the iterator from `node.iter_children()`,
+    and a child is built when selection needs a new one: a node visited N
+    times may have up to ceil(widening_constant * N ** widening_exponent)
+    children (and at least one), so most successors of a wide node are
+    never built at all.
+    `children[node]` holds the children built so far. The other options are
+    those of MCTS.
+    """
+    def __init__(self, exploration_weight=1, widening_constant=1, widening_exponent=0.5, **kwargs):
+        super().__init__(exploration_weight, **kwargs)
+        self.widening_constant = widening_constant
+        self.widening_exponent = widening_exponent
+        self.untried = dict()  # iterator of the children not built yet, for nodes that may still widen
+
+    def reroot(self, node):
+        super().reroot(node)
+        self.untried = {n: it for n, it in self.untried.items() if n in self.children}
+
+    def _evict(self):
+        super()._evict()
+        # An evicted node is expanded from scratch if it is reached again
+        self.untried = {n: it for n, it in self.untried.items() if n in self.children}
+
+    def _max_children(self, node):
+        return max(1, math.ceil(self.widening_constant * self.N[node] ** self.widening_exponent))
+
+    def _select(self, node):
+        """Find an unexplored descendent of `node`, building a new child where the schedule allows one"""
+        path = []
+        while True:
+            path.append(node)
+            if node not in self.children:
+                return path  # node is unexplored
+            children = self.children[node]
+            if len(children) < self._max_children(node):
+                child = self._widen(node)
+                if child is not None:
+                    path.append(child)
+                    return path
+            if not children:
+                return path  # node is terminal
+            unexplored = children - self.children.keys()
+            if unexplored:
+                path.append(unexplored.pop())
+                return path
+            node = self._uct_select(node)  # descend a layer deeper
+
+    def _widen(self, node):
+        """Build the next untried child of `node`, None once they are all built"""
+        untried = self.untried.get(node)
+        if untried is None:
+            return None
+        children = self.children[node]
+        profiler = self.profiler
+        while True:
+            if profiler is None:
+                child = next(untried, None)
+            else:  # a lazy iter_children builds each child here
+                child = profiler.call("find_children", next, untried, None)
+            if child is None:
+                break
+            if self.canonicalize:
+                child = child.canonical()
+            if child not in children:  # skip symmetric duplicates
+                children.add(child)
+                if self.observer.enabled:
+                    self.observer.emit(Expand(node, len(children)))
+                return child
+        del self.untried[node]
+        return None
+
+    def _expand(self, node):
+        """Add `node` to the tree without building any of its children"""
+        if node in self.children:
+            return  # already expanded
+        if self.profiler is None:
+            untried = node.iter_children()
+        else:  # only builds the children here if iter_children is eager, see _widen
+            untried = self.profiler.call("find_children", node.iter_children)
+        self.children[node] = set()
+        self.untried[node] = untried
+
+
 class Node(ABC):
     """
     A representation of a single board state.
     MCTS works by constructing a tree of these Nodes.
     Could be e.g. a chess or checkers board state.
     """
+    __slots__ = ()
 
     @abstractmethod
     def find_children(self):
@@ -119,6 +840,30 @@ class Node(ABC):
         """Assumes `self` is terminal node. 1=win, 0=loss, .5=tie, etc"""
         return 0
 
+    def canonical(self):
+        """
+        Representative of this state's symmetry class (rotations, reflections,
+        etc.). Equivalent states must return the same representative, which
+        must itself be an equivalent state. Only used with canonicalize=True.
+        """
+        return self
+
+    def iter_children(self):
+        """
+        Lazily yields the successors of this board state, in the order they
+        should be tried. Only used by ProgressiveWideningMCTS; override it to
+        build each child only when it is asked for.
+        """
+        return iter(self.find_children())
+
+    def move_to(self, child):
+        """
+        The move that turns this state into its successor `child`, or None if
+        it has no name. Moves must be hashable and mean the same in every
+        state, e.g. a square. Only used by RaveMCTS.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not name its moves")
+
     @abstractmethod
     def __hash__(self):
         """Nodes must be hashable"""
@@ -0,0 +1,114 @@
+"""
+Perfect-play book for tic-tac-toe.
+`OpeningBook.build()` solves the whole game once by exhaustive minimax over
+`find_children` (5478 positions) and keeps, for every position with moves
+left, its game value and the set of squares that keep that value. A book
+entry packs into 32 bits:
+    bits 0-17   the board (TicTacToeBoard is an 18-bit integer)
+    bits 18-26  the best squares, bit i for square i
+    bits 27-28  the game value for the player to move, plus one (0 loss, 1 draw, 2 win)
+so the whole book is an 18 kB array on disk, and a dict in memory.
+Pass a book to `MCTS(book=...)` (or ArrayMCTS) to answer every covered
+position from it with no search. Run this file to write the book to disk.
+"""
+from array import array
+import random
+import sys
+
+from tic_tac_toe import TicTacToeBoard, new_tic_tac_toe_board
+
+_KEY_MASK = (1 << 18) - 1
+
+
+def solve(board, values=None):
+    """
+    Game value of `board` under perfect play for the player to move: 1 win,
+    0 draw, -1 loss. `values` collects the value of every position below it.
+    """
+    if values is None:
+        values = dict()
+    value = values.get(board)
+    if value is None:
+        if board.is_terminal():
+            value = 0 if board.winner is None else -1  # only the previous player can have won
+        else:
+            value = max(-solve(child, values) for child in board.find_children())
+        values[board] = value
+    return value
+
+
+class OpeningBook:
+    """The value and best moves of tic-tac-toe positions, keyed by board"""
+    def __init__(self, entries=()):
+        self.table = {entry & _KEY_MASK: entry >> 18 for entry in entries}
+
+    @classmethod
+    def build(cls, root=None):
+        """Solve every position reachable from `root` (the empty board by default)"""
+        if root is None:
+            root = new_tic_tac_toe_board()
+        values = dict()
+        solve(root, values)
+        entries = []
+        for board, value in values.items():
+            if board.is_terminal():
+                continue
+            best = 0
+            for child in board.find_children():
+                if -values[child] == value:
+                    best |= 1 << board.move_to(child)
+            entries.append(board | best << 18 | (value + 1) << 27)
+        return cls(entries)
+
+    @classmethod
+    def load(cls, path):
+        entries = array("I")
+        with open(path, "rb") as f:
+            entries.frombytes(f.read())
+        if sys.byteorder == "big":
+            entries.byteswap()  # the file is little-endian
+        return cls(entries)
+
+    def save(self, path):
+        entries = array("I", sorted(key | packed << 18 for key, packed in self.table.items()))
+        if sys.byteorder == "big":
+            entries.byteswap()
+        with open(path, "wb") as f:
+            f.write(entries.tobytes())
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, board):
+        return board in self.table
+
+    def value(self, board):
+        """Game value for the player to move, None if the book does not cover `board`"""
+        packed = self.table.get(board)
+        return None if packed is None else (packed >> 9) - 1
+
+    def best_moves(self, board):
+        """The squares that keep the game value, None if the book does not cover `board`"""
+        packed = self.table.get(board)
+        if packed is None:
+            return None
+        return [i for i in range(9) if packed >> i & 1]
+
+    def choose(self, board):
+        """A perfect move from `board` chosen at random among the best, None if it is not covered"""
+        moves = self.best_moves(board)
+        if not moves:
+            return None
+        return TicTacToeBoard(board).make_move(random.choice(moves))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[0] if argv else "tic_tac_toe_book.bin"
+    book = OpeningBook.build()
+    book.save(path)
+    print(f"{len(book)} positions written to {path}")
+
+
+if __name__ == "__main__":
+    main()
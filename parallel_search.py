@@ -0,0 +1,288 @@
+"""
+Parallel drivers for MCTS.
+Root parallelism: every worker process grows its own independent tree from
+the same root with its own random seed, and only the statistics of the
+root's children are merged at the end. No state is shared while searching.
+Tree parallelism: the workers grow one tree together. Node statistics live
+in shared memory and a virtual loss spreads the workers over the branches.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from itertools import repeat
+import math
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+import os
+import pickle
+import random
+import numpy as np
+from monte_carlo_tree_search import MCTS
+
+
+def _root_worker(root, n_rollouts, seed, tree_factory, tree_kwargs):
+    """Search `root` in a fresh tree and return its root-child statistics"""
+    random.seed(seed)
+    tree = tree_factory(**tree_kwargs)
+    for _ in range(n_rollouts):
+        tree.do_rollout(root)
+    return tree._child_stats(root)
+
+
+def _split(total, parts):
+    """Split `total` into `parts` near-equal non-negative shares"""
+    share, extra = divmod(total, parts)
+    return [share + (i < extra) for i in range(parts)]
+
+
+def root_parallel_search(root, n_rollouts, workers=None, seed=None, executor=None,
+                         tree_factory=MCTS, **tree_kwargs):
+    """
+    Run `n_rollouts` rollouts from `root`, split over `workers` independent
+    trees built by `tree_factory(**tree_kwargs)` in separate processes.
+    Returns an MCTS holding the merged root-child statistics, so the move
+    is picked with `root_parallel_search(...).choose(root)`.
+    Pass a long-lived `executor` to avoid starting a pool on every move.
+    """
+    workers = workers or os.cpu_count()
+    rng = random.Random(seed)
+    seeds = [rng.getrandbits(64) for _ in range(workers)]
+    jobs = (repeat(root), _split(n_rollouts, workers), seeds, repeat(tree_factory), repeat(tree_kwargs))
+    if executor is None:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_root_worker, *jobs))
+    else:
+        results = list(executor.map(_root_worker, *jobs))
+
+    tree = MCTS(canonicalize=tree_kwargs.get("canonicalize", False))
+    key = root.canonical() if tree.canonicalize else root
+    children = set()
+    for stats in results:
+        for child, q, n in stats:
+            children.add(child)
+            tree.Q[child] += q
+            tree.N[child] += n
+            tree.Q[key] += n - q  # the root sees every reward inverted
+            tree.N[key] += n
+    if children:
+        tree.children[key] = children
+    return tree
+
+
+def _node_key(node):
+    """Stable non-zero 64-bit key of a node, identical in every process"""
+    digest = blake2b(pickle.dumps(node, protocol=4), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+class SharedNodeTable:
+    """
+    Fixed-capacity open-addressing table from nodes to their statistics,
+    held in one shared memory block so that every process attached to it
+    reads and updates the same Q, N and virtual loss columns.
+    Create it once in the parent (optionally as a context manager); worker
+    processes attach by `name`. Inserts and virtual loss updates are
+    serialized by `lock`; lookups are lock-free.
+    """
+    _columns = (("keys", np.uint64), ("Q", np.float64), ("N", np.int64), ("virtual", np.int64))
+
+    def __init__(self, capacity=1 << 20, name=None, lock=None):
+        if capacity & (capacity - 1):
+            raise ValueError(f"capacity must be a power of two, got {capacity}")
+        self.capacity = capacity
+        self.lock = lock if lock is not None else multiprocessing.Lock()
+        create = name is None
+        self.shm = SharedMemory(name=name, create=create, size=capacity * 8 * len(self._columns))
+        self.name = self.shm.name
+        for i, (column, dtype) in enumerate(self._columns):
+            setattr(self, column, np.ndarray(capacity, dtype, self.shm.buf, offset=i * capacity * 8))
+        if create:
+            self.keys[:] = 0  # 0 marks an empty slot
+        self._slots = dict()  # slot of each node this process has looked up
+
+    def find(self, node):
+        """Slot of `node`, or None if no process has inserted it"""
+        slot = self._slots.get(node)
+        if slot is None:
+            slot = self._probe(_node_key(node))
+            if slot is not None and self.keys[slot]:
+                self._slots[node] = slot
+            else:
+                slot = None
+        return slot
+
+    def slot(self, node):
+        """Slot of `node`, inserting it if needed"""
+        slot = self._slots.get(node)
+        if slot is not None:
+            return slot
+        key = _node_key(node)
+        slot = self._probe(key)
+        if slot is None or not self.keys[slot]:
+            with self.lock:  # another process may have inserted it meanwhile
+                slot = self._probe(key)
+                if slot is None:
+                    raise RuntimeError(f"shared node table is full ({self.capacity} nodes)")
+                self.keys[slot] = key
+        self._slots[node] = slot
+        return slot
+
+    def _probe(self, key):
+        """Slot holding `key` or the empty slot where it belongs, None if full"""
+        mask = self.capacity - 1
+        slot = key & mask
+        for _ in range(self.capacity):
+            k = int(self.keys[slot])
+            if k == key or k == 0:
+                return slot
+            slot = (slot + 1) & mask
+        return None
+
+    def close(self):
+        """Detach this process from the table"""
+        for column, _ in self._columns:
+            setattr(self, column, None)
+        self.shm.close()
+
+    def unlink(self):
+        """Free the shared memory block, once every process has closed it"""
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        self.unlink()
+
+
+class SharedTreeMCTS(MCTS):
+    """
+    MCTS whose node statistics live in a SharedNodeTable, so that several
+    processes grow one tree together. Each process mirrors the structure
+    (`children`) locally as it walks the tree; only the statistics are
+    shared. Every node on a selected path carries `virtual_loss` extra
+    visits without reward until its rollout is backpropagated, which steers
+    concurrent workers towards different branches.
+    Virtual loss is added and lifted under the table's lock, so that no
+    update is lost and it always returns to zero; Q and N are updated in the
+    same critical section while the virtual loss is lifted.
+    """
+    def __init__(self, table, exploration_weight=1, virtual_loss=1):
+        super().__init__(exploration_weight)
+        self.table = table
+        self.virtual_loss = virtual_loss
+
+    def choose(self, node):
+        """Choose the best successor of node. (Choose a move in the game)"""
+        if node.is_terminal():
+            raise RuntimeError(f"choose called on terminal node {node}")
+
+        stats = self._child_stats(node)
+        if not stats:
+            return node.find_random_child()
+
+        def score(stat):
+            _, q, n = stat
+            if n == 0:
+                return float("-inf")  # avoid unseen moves
+            return q / n  # average reward
+
+        return max(stats, key=score)[0]
+
+    def _child_stats(self, node):
+        slot = self.table.find(node)
+        if slot is None or self.table.N[slot] == 0:
+            return []
+        self._expand(node)
+        stats = []
+        for n in self.children[node]:
+            s = self.table.find(n)
+            stats.append((n, 0, 0) if s is None else (n, float(self.table.Q[s]), int(self.table.N[s])))
+        return stats
+
+    def _select(self, node):
+        """Find an unexplored descendent of `node`, adding virtual loss on the way"""
+        table = self.table
+        path = []
+        while True:
+            path.append(node)
+            slot = table.slot(node)
+            with table.lock:
+                table.virtual[slot] += self.virtual_loss
+            if node not in self.children:
+                if table.N[slot] == 0:
+                    return path  # no worker has explored it yet
+                self._expand(node)  # explored by another worker, mirror it locally
+            if not self.children[node]:
+                return path  # terminal
+            node = self._uct_select(node)  # descend a layer deeper
+
+    def _backpropagate(self, path, reward):
+        """Send the reward back up to the ancestors of the leaf, lifting the virtual loss"""
+        table = self.table
+        for node in reversed(path):
+            slot = table.slot(node)
+            with table.lock:
+                table.virtual[slot] -= self.virtual_loss
+                table.N[slot] += 1
+                table.Q[slot] += reward
+            reward = 1 - reward  # 1 for me is 0 for my enemy, and vice versa
+
+    def _uct_select(self, node):
+        """Select a child of node, counting in-flight visits as losses"""
+        table = self.table
+        parent = table.slot(node)
+        log_N_vertex = math.log(max(table.N[parent] + table.virtual[parent], 1))
+
+        def uct(n):
+            """Upper confidence bound for trees, with virtual loss"""
+            slot = table.find(n)
+            if slot is None:
+                return float("inf")  # not even inserted yet
+            visits = table.N[slot] + table.virtual[slot]
+            if visits <= 0:
+                return float("inf")  # nobody has tried it yet
+            return table.Q[slot] / visits + self.exploration_weight * math.sqrt(
+                log_N_vertex / visits
+            )
+
+        return max(self.children[node], key=uct)
+
+
+_worker_table = None
+
+
+def _attach_table(name, capacity, lock):
+    global _worker_table
+    _worker_table = SharedNodeTable(capacity, name=name, lock=lock)
+
+
+def _tree_worker(root, n_rollouts, seed, exploration_weight, virtual_loss):
+    """Grow the shared tree of this worker process from `root`"""
+    random.seed(seed)
+    tree = SharedTreeMCTS(_worker_table, exploration_weight, virtual_loss)
+    for _ in range(n_rollouts):
+        tree.do_rollout(root)
+
+
+def tree_parallel_search(table, root, n_rollouts, workers=None, seed=None,
+                         exploration_weight=1, virtual_loss=1):
+    """
+    Run `n_rollouts` rollouts from `root`, split over `workers` processes
+    that all grow the tree stored in the SharedNodeTable `table`.
+    Returns a SharedTreeMCTS over `table`, so the move is picked with
+    `tree_parallel_search(...).choose(root)`. The table keeps its
+    statistics, so later moves can reuse it; any virtual loss left over,
+    e.g. by a worker that died mid-rollout, is cleared on return.
+    """
+    workers = workers or os.cpu_count()
+    rng = random.Random(seed)
+    seeds = [rng.getrandbits(64) for _ in range(workers)]
+    try:
+        with ProcessPoolExecutor(workers, initializer=_attach_table,
+                                 initargs=(table.name, table.capacity, table.lock)) as pool:
+            list(pool.map(_tree_worker, repeat(root), _split(n_rollouts, workers), seeds,
+                          repeat(exploration_weight), repeat(virtual_loss)))
+    finally:
+        table.virtual[:] = 0
+    return SharedTreeMCTS(table, exploration_weight, virtual_loss)
@@ -0,0 +1,109 @@
+"""
+Built-in profiling of MCTS rollouts.
+`MCTS(profile=True)` attaches a RolloutProfiler, which wraps the four
+phases of the tree (`_select`, `_expand`, `_simulate`, `_backpropagate`)
+with timers and also times the game callbacks `find_children` and
+`find_random_child`. Without it the tree runs the plain, untimed methods.
+The collected numbers are exported with `as_dict` or, in the Prometheus
+text exposition format, with `to_prometheus`.
+"""
+from collections import Counter
+import time
+
+PHASES = ("select", "expand", "simulate", "backpropagate")
+CALLBACKS = ("find_children", "find_random_child")
+# Upper bounds of the rollout depth histogram buckets, the same in every export
+DEPTH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class RolloutProfiler:
+    """Cumulative time and call counts per phase and callback, plus a depth histogram"""
+    def __init__(self):
+        self.seconds = Counter()  # cumulative time of each phase and callback
+        self.calls = Counter()  # number of calls of each phase and callback
+        self.depths = Counter()  # number of rollouts for each selected path length
+        self.rollouts = 0
+        self.started = time.perf_counter()
+
+    def instrument(self, tree):
+        """Replace the phase methods of `tree` with timed wrappers"""
+        for phase in PHASES:
+            setattr(tree, "_" + phase, self._timed(phase, getattr(tree, "_" + phase)))
+
+    def _timed(self, name, method):
+        seconds, calls = self.seconds, self.calls
+
+        def timed(*args):
+            start = time.perf_counter()
+            result = method(*args)
+            seconds[name] += time.perf_counter() - start
+            calls[name] += 1
+            if name == "select":
+                self.depths[len(result)] += 1
+            elif name == "backpropagate":
+                self.rollouts += 1
+            return result
+
+        return timed
+
+    def call(self, name, callback, *args):
+        """Time one game callback"""
+        start = time.perf_counter()
+        result = callback(*args)
+        self.seconds[name] += time.perf_counter() - start
+        self.calls[name] += 1
+        return result
+
+    def as_dict(self, tree_size=None):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "rollouts": self.rollouts,
+            "elapsed_seconds": elapsed,
+            "rollouts_per_second": self.rollouts / elapsed if elapsed else 0.0,
+            "tree_size": tree_size,
+            "phases": {name: {"seconds": self.seconds[name], "calls": self.calls[name]} for name in PHASES},
+            "callbacks": {name: {"seconds": self.seconds[name], "calls": self.calls[name]} for name in CALLBACKS},
+            "depth_histogram": dict(sorted(self.depths.items())),
+        }
+
+    def to_prometheus(self, tree_size=None, prefix="mcts"):
+        stats = self.as_dict(tree_size)
+        lines = [
+            f"# HELP {prefix}_rollouts_total Rollouts completed.",
+            f"# TYPE {prefix}_rollouts_total counter",
+            f"{prefix}_rollouts_total {stats['rollouts']}",
+            f"# HELP {prefix}_rollouts_per_second Rollouts per second since the profiler started.",
+            f"# TYPE {prefix}_rollouts_per_second gauge",
+            f"{prefix}_rollouts_per_second {stats['rollouts_per_second']}",
+        ]
+        if tree_size is not None:
+            lines += [
+                f"# HELP {prefix}_tree_nodes Nodes held by the tree.",
+                f"# TYPE {prefix}_tree_nodes gauge",
+                f"{prefix}_tree_nodes {tree_size}",
+            ]
+        for kind, names in (("phase", PHASES), ("callback", CALLBACKS)):
+            lines += [
+                f"# HELP {prefix}_{kind}_seconds_total Time spent in each rollout {kind}.",
+                f"# TYPE {prefix}_{kind}_seconds_total counter",
+            ]
+            lines += [f'{prefix}_{kind}_seconds_total{{{kind}="{n}"}} {self.seconds[n]}' for n in names]
+            lines += [
+                f"# HELP {prefix}_{kind}_calls_total Calls of each rollout {kind}.",
+                f"# TYPE {prefix}_{kind}_calls_total counter",
+            ]
+            lines += [f'{prefix}_{kind}_calls_total{{{kind}="{n}"}} {self.calls[n]}' for n in names]
+        lines += [
+            f"# HELP {prefix}_rollout_depth Length of the selected path of each rollout.",
+            f"# TYPE {prefix}_rollout_depth histogram",
+        ]
+        for bound in DEPTH_BUCKETS:
+            below = sum(count for depth, count in self.depths.items() if depth <= bound)
+            lines.append(f'{prefix}_rollout_depth_bucket{{le="{bound}"}} {below}')
+        cumulative = sum(self.depths.values())
+        lines += [
+            f'{prefix}_rollout_depth_bucket{{le="+Inf"}} {cumulative}',
+            f"{prefix}_rollout_depth_sum {sum(d * c for d, c in self.depths.items())}",
+            f"{prefix}_rollout_depth_count {cumulative}",
+        ]
+        return "\n".join(lines) + "\n"
@@ -1,70 +1,103 @@
 """
 An example implementation of the abstract Node class for use in MCTS
 If you run this file then you can play against the computer.
-A tic-tac-toe self is represented as a tuple of 9 values, each either None,
-True, or False, respectively meaning 'empty', 'X', and 'O'.
-The self is indexed by row:
+A tic-tac-toe board is packed into a single 18-bit integer: bit i is set
+when X holds square i, and bit 9 + i when O holds it.
+The board is indexed by row:
 0 1 2
 3 4 5
 6 7 8
-For example, this game self
+For example, this game board
 O - X
 O X -
 X - -
-corrresponds to this tuple:
-(False, None, True, False, True, None, True, None, None)
+has X on squares 2, 4 and 6 and O on squares 0 and 3, so it corresponds to
+0b001010100 | 0b000001001 << 9 == 4692
+Whose turn it is, the winner and whether the game is over all follow from
+the two 9-bit halves through the lookup tables at the bottom of this file.
 """
 
-from collections import namedtuple
-from random import choice
+from random import choice, shuffle
 from monte_carlo_tree_search import MCTS, Node
-from tqdm.auto import tqdm
 
-_TTTB = namedtuple("TicTacToeBoard", "tup turn winner terminal")
+_FULL = 0b111111111  # all nine squares
 
 
-# Inheriting from a namedtuple is convenient because it makes the class
-# immutable and predefines __init__, __repr__, __hash__, __eq__, and others
-class TicTacToeBoard(_TTTB, Node):
+# Inheriting from int is convenient because it makes the class immutable,
+# makes each board a single small key and predefines __hash__, __eq__, and others
+class TicTacToeBoard(int, Node):
+    __slots__ = ()
+
+    @property
+    def turn(self):
+        """True if it is X's turn, False if it is O's"""
+        return (self & _FULL).bit_count() == (self >> 9).bit_count()
+
+    @property
+    def winner(self):
+        return _find_winner(self & _FULL, self >> 9)
+
+    @property
+    def terminal(self):
+        x, o = self & _FULL, self >> 9
+        return bool(_WINS[x] or _WINS[o]) or (x | o) == _FULL
+
+    @property
+    def tup(self):
+        """The board as a tuple of 9 values, each None (empty), True (X) or False (O)"""
+        x, o = self & _FULL, self >> 9
+        return tuple(
+            True if x >> i & 1 else (False if o >> i & 1 else None) for i in range(9)
+        )
+
     def find_children(self):
         if self.terminal:  # If the game is finished then no moves can be made
             return set()
         # Otherwise, you can make a move in each of the empty spots
-        return {self.make_move(i) for i, value in enumerate(self.tup) if value is None}
+        return {self.make_move(i) for i in _EMPTY_SQUARES[~(self | self >> 9) & _FULL]}
 
     def find_random_child(self):
         if self.terminal:
             return None  # If the game is finished then no moves can be made
-        empty_spots = [i for i, value in enumerate(self.tup) if value is None]
-        return self.make_move(choice(empty_spots))
+        return self.make_move(choice(_EMPTY_SQUARES[~(self | self >> 9) & _FULL]))
+
+    def iter_children(self):
+        if self.terminal:
+            return
+        squares = list(_EMPTY_SQUARES[~(self | self >> 9) & _FULL])
+        shuffle(squares)  # try the moves in random order
+        for i in squares:
+            yield self.make_move(i)
 
     def reward(self):
         if not self.terminal:
-            raise RuntimeError(f"reward called on nonterminal self {self}")
-        if self.winner is self.turn:
+            raise RuntimeError(f"reward called on nonterminal board {self}")
+        turn, winner = self.turn, self.winner
+        if winner is turn:
             # It's your turn and you've already won. Should be impossible.
-            raise RuntimeError(f"reward called on unreachable self {self}")
-        if self.turn is (not self.winner):
+            raise RuntimeError(f"reward called on unreachable board {self}")
+        if turn is (not winner):
             return 0  # Your opponent has just won. Bad.
-        if self.winner is None:
+        if winner is None:
             return 0.5  # Board is a tie
         # The winner is neither True, False, nor None
-        raise RuntimeError(f"self has unknown winner type {self.winner}")
+        raise RuntimeError(f"board has unknown winner type {winner}")
 
     def is_terminal(self):
         return self.terminal
 
+    def move_to(self, child):
+        """The square played to reach `child`"""
+        return ((child ^ self).bit_length() - 1) % 9
+
     def make_move(self, index):
-        tup = self.tup[:index] + (self.turn,) + self.tup[index + 1:]
-        turn = not self.turn
-        winner = _find_winner(tup)
-        is_terminal = (winner is not None) or not any(v is None for v in tup)
-        return TicTacToeBoard(tup, turn, winner, is_terminal)
+        return TicTacToeBoard(self | 1 << (index if self.turn else index + 9))
 
     def to_pretty_string(self):
         to_char = lambda v: ("X" if v is True else ("O" if v is False else " "))
+        tup = self.tup
         rows = [
-            [to_char(self.tup[3 * row + col]) for col in range(3)] for row in range(3)
+            [to_char(tup[3 * row + col]) for col in range(3)] for row in range(3)
         ]
         return (
                 "\n  1 2 3\n"
@@ -72,6 +105,14 @@ class TicTacToeBoard(_TTTB, Node):
                 + "\n"
         )
 
+    def canonical(self):
+        """The smallest key among the 8 rotations and reflections of this board"""
+        x, o = self & _FULL, self >> 9
+        return TicTacToeBoard(min(table[x] | table[o] << 9 for table in _SYMMETRIES))
+
+    def __repr__(self):
+        return f"TicTacToeBoard(x=0b{self & _FULL:09b}, o=0b{self >> 9:09b})"
+
 
 def play_game():
     tree = MCTS()
@@ -87,11 +128,10 @@ def play_game():
         print(board.to_pretty_string())
         if board.terminal:
             break
+        tree.reroot(board)  # forget the branches the game can no longer reach
         # You can train as you go, or only at the beginning.
-        # Here, we train as we go, doing fifty rollouts each turn.
-        for _ in tqdm(range(2)):
-            tree.do_rollout(board)
-        board = tree.choose(board)
+        # Here, we train as we go, searching for up to half a second each turn.
+        board = tree.search(board, time_budget=0.5)
         print(board.to_pretty_string())
         if board.terminal:
             break
@@ -106,19 +146,44 @@ def _winning_combos():
     yield 2, 4, 6  # down-left diagonal
 
 
-def _find_winner(tup):
+def _find_winner(x, o):
     "Returns None if no winner, True if X wins, False if O wins"
-    for i1, i2, i3 in _winning_combos():
-        v1, v2, v3 = tup[i1], tup[i2], tup[i3]
-        if False is v1 is v2 is v3:
-            return False
-        if True is v1 is v2 is v3:
-            return True
+    if _WINS[x]:
+        return True
+    if _WINS[o]:
+        return False
     return None
 
 
+# _WINS[mask] is 1 if the squares in the 9-bit `mask` contain a whole line
+_WINS = bytes(
+    any(sum(1 << i for i in combo) & mask == sum(1 << i for i in combo) for combo in _winning_combos())
+    for mask in range(1 << 9)
+)
+# _EMPTY_SQUARES[mask] lists the squares set in the 9-bit `mask`
+_EMPTY_SQUARES = tuple(tuple(i for i in range(9) if mask >> i & 1) for mask in range(1 << 9))
+
+
+def _symmetries():
+    """The 8 rotations and reflections of the board, as square permutations"""
+    rotate = lambda s: 3 * (s % 3) + 2 - s // 3  # quarter turn clockwise
+    reflect = lambda s: s - s % 3 + 2 - s % 3  # mirror left to right
+    permutation = tuple(range(9))
+    for _ in range(4):
+        yield permutation
+        yield tuple(reflect(s) for s in permutation)
+        permutation = tuple(rotate(s) for s in permutation)
+
+
+# _SYMMETRIES[k][mask] is the 9-bit `mask` moved by the k-th symmetry
+_SYMMETRIES = tuple(
+    tuple(sum(1 << permutation[i] for i in range(9) if mask >> i & 1) for mask in range(1 << 9))
+    for permutation in _symmetries()
+)
+
+
 def new_tic_tac_toe_board():
-    return TicTacToeBoard(tup=(None,) * 9, turn=True, winner=None, terminal=False)
+    return TicTacToeBoard(0)
 
 
 if __name__ == "__main__":
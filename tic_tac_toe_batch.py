@@ -0,0 +1,56 @@
+"""
+Vectorized random playouts for TicTacToeBoard.
+`BatchRollout` plays many random continuations of one board at once as
+NumPy array operations over the two 9-bit halves of the board, and returns
+their average reward. Use it as `MCTS(simulator=BatchRollout())`.
+"""
+import numpy as np
+from tic_tac_toe import _EMPTY_SQUARES, _FULL, _WINS
+
+_WIN = np.frombuffer(_WINS, dtype=np.uint8).astype(bool)
+_COUNT = np.array([len(squares) for squares in _EMPTY_SQUARES], dtype=np.int64)
+# _NTH_SQUARE[mask, k] is the k-th square set in the 9-bit `mask`
+_NTH_SQUARE = np.zeros((1 << 9, 9), dtype=np.int64)
+for _mask, _squares in enumerate(_EMPTY_SQUARES):
+    _NTH_SQUARE[_mask, :len(_squares)] = _squares
+
+
+class BatchRollout:
+    """Average reward of `n_playouts` random playouts of a board"""
+    def __init__(self, n_playouts=256, seed=None):
+        self.n_playouts = n_playouts
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, board):
+        """Reward of the player who moved into `board`, like MCTS._simulate"""
+        if board.terminal:
+            return 1 - board.reward()
+        return float(self.playouts(board).mean())
+
+    def playouts(self, board):
+        """Rewards of the player who moved into `board` in each playout"""
+        n = self.n_playouts
+        x = np.full(n, board & _FULL, dtype=np.int64)
+        o = np.full(n, board >> 9, dtype=np.int64)
+        winner = np.zeros(n, dtype=np.int8)  # 1 if X won, -1 if O won, 0 for a tie
+        active = np.arange(n)
+        turn = board.turn
+        # Every playout moves on every ply, so they all share whose turn it is
+        while len(active):
+            xa, oa = x[active], o[active]
+            empty = ~(xa | oa) & _FULL
+            k = (self.rng.random(len(active)) * _COUNT[empty]).astype(np.int64)
+            bit = 1 << _NTH_SQUARE[empty, k]
+            if turn:
+                xa |= bit
+                x[active] = xa
+                won = _WIN[xa]
+            else:
+                oa |= bit
+                o[active] = oa
+                won = _WIN[oa]
+            winner[active[won]] = 1 if turn else -1
+            active = active[~won & ((xa | oa) != _FULL)]
+            turn = not turn
+        mover = -1 if board.turn else 1  # the player who just moved
+        return np.where(winner == mover, 1.0, np.where(winner == 0, 0.5, 0.0))
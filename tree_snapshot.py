@@ -0,0 +1,133 @@
+"""
+Compact binary snapshots of a search tree, for warm starts.
+A snapshot stores the integer key, Q and N of every node in the tree, and
+the children of every expanded node as CSR offsets into one edge column.
+Keys are sorted, so `TreeSnapshot` finds a node by binary search directly
+in the read-only memory map of the file: nothing is deserialized, and every
+process opening the same snapshot shares its pages.
+
+Layout, little endian, every field 8 bytes wide:
+    header   magic, n_nodes, n_edges, flags
+    keys     uint64[n_nodes], sorted
+    Q        float64[n_nodes]
+    N        int64[n_nodes]
+    offsets  int64[n_nodes + 1], node i has children edges[offsets[i]:offsets[i + 1]]
+    edges    int64[n_edges], indices of the child nodes
+"""
+import mmap
+import struct
+import numpy as np
+from monte_carlo_tree_search import ArrayMCTS
+
+_MAGIC = b"MCTSNAP1"
+_HEADER = struct.Struct("<8sQQQ")
+_CANONICAL = 1  # flag: the tree was built with canonicalize=True
+
+
+def _tree_rows(tree):
+    """(node, Q, N, children) for every node of an MCTS or ArrayMCTS"""
+    if isinstance(tree, ArrayMCTS):
+        for i, node in enumerate(tree.nodes):
+            children = [] if tree.first_child[i] < 0 else [tree.nodes[c] for c in tree._child_ids(i)]
+            yield node, tree.Q[i], tree.N[i], children
+        return
+    nodes = set(tree.N) | set(tree.children)
+    for children in tree.children.values():
+        nodes.update(children)
+    for node in nodes:
+        yield node, tree.Q.get(node, 0), tree.N.get(node, 0), tree.children.get(node, ())
+
+
+def save_snapshot(tree, path, key=int):
+    """Write `tree` (MCTS or ArrayMCTS) to `path`; `key` maps a node to a uint64"""
+    rows = list(_tree_rows(tree))
+    keys = np.array([key(node) for node, _, _, _ in rows], dtype=np.uint64)
+    order = np.argsort(keys, kind="stable")
+    index = {rows[old][0]: new for new, old in enumerate(order)}
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    edges = []
+    for new, old in enumerate(order):
+        children = rows[old][3]
+        edges.extend(index[c] for c in children)
+        offsets[new + 1] = len(edges)
+    flags = _CANONICAL if tree.canonicalize else 0
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(rows), len(edges), flags))
+        f.write(keys[order].tobytes())
+        f.write(np.array([rows[i][1] for i in order], dtype=np.float64).tobytes())
+        f.write(np.array([rows[i][2] for i in order], dtype=np.int64).tobytes())
+        f.write(offsets.tobytes())
+        f.write(np.array(edges, dtype=np.int64).tobytes())
+
+
+class TreeSnapshot:
+    """
+    Read-only view of a snapshot written by `save_snapshot`, answering
+    `choose` like the tree it was saved from. `from_key` rebuilds a node
+    from its key and `key` must be the function the snapshot was saved with.
+    """
+    def __init__(self, path, from_key, key=int):
+        self.from_key = from_key
+        self.key = key
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_nodes, n_edges, flags = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a tree snapshot")
+        self.canonicalize = bool(flags & _CANONICAL)
+        offset = _HEADER.size
+        columns = []
+        for dtype, count in ((np.uint64, n_nodes), (np.float64, n_nodes), (np.int64, n_nodes),
+                             (np.int64, n_nodes + 1), (np.int64, n_edges)):
+            columns.append(np.frombuffer(self._mmap, dtype, count, offset))
+            offset += 8 * count
+        self.keys, self.Q, self.N, self.offsets, self.edges = columns
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _index(self, node):
+        """Row of `node` in the snapshot, or None"""
+        if self.canonicalize:
+            node = node.canonical()
+        k = self.key(node)
+        i = int(np.searchsorted(self.keys, k))
+        if i < len(self.keys) and self.keys[i] == k:
+            return i
+        return None
+
+    def _child_stats(self, node):
+        """(child, Q, N) for each tree child of `node`, empty if it is unexpanded"""
+        i = self._index(node)
+        if i is None:
+            return []
+        children = self.edges[self.offsets[i]:self.offsets[i + 1]]
+        return [(self.from_key(int(self.keys[c])), float(self.Q[c]), int(self.N[c])) for c in children]
+
+    def choose(self, node):
+        """Choose the best successor of node. (Choose a move in the game)"""
+        if node.is_terminal():
+            raise RuntimeError(f"choose called on terminal node {node}")
+
+        i = self._index(node)
+        if i is None or self.offsets[i] == self.offsets[i + 1]:
+            return node.find_random_child()
+
+        children = self.edges[self.offsets[i]:self.offsets[i + 1]]
+        n = self.N[children]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = np.where(n > 0, self.Q[children] / n, -np.inf)  # avoid unseen moves
+        child = self.from_key(int(self.keys[children[score.argmax()]]))
+        if not self.canonicalize:
+            return child
+        return next(c for c in node.find_children() if c.canonical() == child)
+
+    def close(self):
+        self.keys = self.Q = self.N = self.offsets = self.edges = None
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()